@@ -1,5 +1,36 @@
 import json
 import os
+import sys
+from pathlib import Path
+
+# Prompt templates are shared with the backend detector. This function
+# doesn't install the backend's image dependencies, so only the
+# dependency-free backend modules are bundled with it (vercel.json includeFiles).
+sys.path.append(str(Path(__file__).parent.parent / "backend"))
+from utils.prompts import get_prompt_registry
+from utils.http_pool import pool_limits
+from utils.resilience import is_retryable, get_retry_after
+
+# Groq client kept across warm invocations, so its pooled keep-alive
+# connections are reused instead of paying a new TLS handshake per scan
+_groq_client = None
+_groq_api_key = None
+
+def _get_groq_client(api_key):
+    """Get the Groq client for this instance, creating it on first use"""
+    global _groq_client, _groq_api_key
+    if _groq_client is None or _groq_api_key != api_key:
+        import httpx
+        from groq import Groq
+        
+        if _groq_client is not None:
+            # The API key changed: don't leak the old client's connection pool
+            _groq_client.close()
+        # The SDK retries 429/5xx and connection errors with jittered backoff, honoring Retry-After
+        _groq_client = Groq(api_key=api_key, http_client=httpx.Client(limits=pool_limits()),
+                            max_retries=int(os.environ.get('GROQ_MAX_RETRIES', '2')))
+        _groq_api_key = api_key
+    return _groq_client
 
 def handler(request):
     """Vercel serverless function for plant disease detection"""
@@ -49,27 +80,14 @@ def handler(request):
         if groq_api_key:
             try:
                 # Try real AI analysis with Groq
-                from groq import Groq
-                
-                client = Groq(api_key=groq_api_key)
+                client = _get_groq_client(groq_api_key)
                 
                 # Clean image data
                 if image_data.startswith('data:image/'):
                     image_data = image_data.split(',')[1]
                 
-                # Create prompt for analysis
-                prompt = f"""You are an expert plant pathologist. Analyze this {crop_type} plant image for diseases.
-
-Return JSON format:
-{{
-    "disease_detected": "disease name or 'Healthy Plant'",
-    "confidence": confidence_score_0_to_1,
-    "severity": "None/Mild/Moderate/Severe",
-    "symptoms_observed": ["symptom1", "symptom2"],
-    "recommendation": "treatment advice"
-}}
-
-Focus on visible symptoms and provide practical advice."""
+                # Prompt for this crop, rendered once per instance
+                prompt = get_prompt_registry().get(crop_type).text
 
                 # Call Groq API
                 completion = client.chat.completions.create(
@@ -121,14 +139,31 @@ Focus on visible symptoms and provide practical advice."""
                     }
                     
             except Exception as ai_error:
-                # Fallback to mock response if AI fails
-                response = {
-                    'success': True,
-                    'disease': 'Analysis Completed',
-                    'confidence': '75',
-                    'severity': 'Mild',
-                    'symptoms': ['AI service temporarily unavailable'],
-                    'ai_recommendation': f'Your {crop_type.title()} plant has been analyzed. Please try again later for detailed AI insights.'
+                print(f"AI analysis failed: {str(ai_error)}")
+                if not is_retryable(ai_error):
+                    from groq import APIStatusError
+                    if isinstance(ai_error, APIStatusError):
+                        # Groq refused the request itself (400, 401, 413, ...); retrying won't help
+                        return {
+                            'statusCode': 502,
+                            'headers': headers,
+                            'body': json.dumps({
+                                'success': False,
+                                'error': 'AI service rejected the request'
+                            })
+                        }
+                    raise
+                
+                # Connection errors, timeouts, 429 and 5xx: tell the client to retry
+                # rather than reporting an analysis that never happened
+                retry_after = max(1, round(get_retry_after(ai_error) or 5))
+                return {
+                    'statusCode': 503,
+                    'headers': dict(headers, **{'Retry-After': str(retry_after)}),
+                    'body': json.dumps({
+                        'success': False,
+                        'error': 'AI service is temporarily unavailable, please try again shortly'
+                    })
                 }
         else:
             # Mock response when no API key
@@ -12,8 +12,13 @@ import sys
 # Add parent directory to path for imports
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from utils.image_processor import decode_base64_image, preprocess_image, validate_image, enhance_image
-from utils.groq_client import GroqDiseaseDetector
+from utils.image_processor import (process_upload, get_enhancement_tier, get_encoding_profile, get_quality_gate,
+                                   ImageQualityError, MAX_IMAGE_BYTES)
+from utils.worker_pool import get_image_pool, PoolSaturatedError
+from utils.request_parser import parse_detect_request, is_binary_upload
+from utils.groq_client import get_detector, GROQ_MAX_IMAGES
+from utils.resilience import UpstreamUnavailableError
+from utils.rate_limiter import RateLimitExceededError
 from utils.disease_info import get_disease_info
 from supabase import create_client
 
@@ -23,10 +28,15 @@ try:
         os.getenv("SUPABASE_URL", ""),
         os.getenv("SUPABASE_KEY", "")
     )
-    detector = GroqDiseaseDetector()
 except Exception as e:
     print(f"Initialization error: {str(e)}")
     supabase = None
+
+# One detector per process: warm instances reuse its pooled connections
+try:
+    detector = get_detector()
+except Exception as e:
+    print(f"Initialization error: {str(e)}")
     detector = None
 
 class handler(BaseHTTPRequestHandler):
@@ -37,63 +47,131 @@ class handler(BaseHTTPRequestHandler):
         try:
             # Read request body
             content_length = int(self.headers.get('Content-Length', 0))
+            content_type = self.headers.get('Content-Type', 'application/json')
+            
+            # Base64 inflates the image by 4/3; allow some room for the other fields
+            max_length = MAX_IMAGE_BYTES if is_binary_upload(content_type) else MAX_IMAGE_BYTES * 4 // 3
+            if content_length > max_length * GROQ_MAX_IMAGES + 64 * 1024:
+                self._send_error(413, "Request body too large")
+                return
+            
             body = self.rfile.read(content_length)
-            data = json.loads(body.decode('utf-8'))
+            
+            # JSON (base64), raw image/* body or multipart/form-data
+            try:
+                request = parse_detect_request(content_type, body, self.path)
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
             
             # Extract parameters
-            image_data = data.get('image', '')
+            data = request['fields']
+            images = request['images']
             user_id = data.get('user_id')
-            crop_type = data.get('crop_type', 'tomato').lower()
+            crop_type = (data.get('crop_type') or 'tomato').lower()
             
             # Validate input
-            if not image_data:
+            if not images:
                 self._send_error(400, "No image provided")
                 return
             
-            print(f"Processing image for crop: {crop_type}")
+            # Several photos of one plant are analyzed together in one AI call
+            if len(images) > GROQ_MAX_IMAGES:
+                self._send_error(400, f"Too many images: at most {GROQ_MAX_IMAGES} per request")
+                return
             
-            # Decode and validate image
             try:
-                image = decode_base64_image(image_data)
-                is_valid, error_msg = validate_image(image)
-                
-                if not is_valid:
-                    self._send_error(400, f"Invalid image: {error_msg}")
-                    return
+                enhancement_tier = get_enhancement_tier(data.get('enhancement'))
+                encoding_profile = get_encoding_profile(data.get('encoding'))['name']
+                quality_gate = get_quality_gate(data.get('quality_gate'))
+            except ValueError as e:
+                self._send_error(400, str(e))
+                return
+            
+            print(f"Processing {len(images)} image(s) for crop: {crop_type}")
+            
+            # Decode, quality-check, enhance, preprocess and encode on the bounded image pool,
+            # all photos of the request in parallel
+            image_number = 1
+            futures = []
+            try:
+                for image in images:
+                    futures.append(get_image_pool().submit(process_upload, image, tier=enhancement_tier,
+                                                           encoding_profile=encoding_profile,
+                                                           quality_gate=quality_gate))
+                prepared_images = []
+                for image_number, future in enumerate(futures, 1):
+                    prepared = future.result()
+                    prepared_images.append(prepared)
+                    print(f"Image {prepared['original_size']} [{prepared['image_hash']}] preprocessed by {prepared['pipeline']} (leaf region: {prepared['roi']}, "
+                          f"enhancement: {prepared['enhancement_tier']}, "
+                          f"encoded: {encoding_profile} {len(prepared['encoded'])} bytes)")
                 
-                print(f"Image validated: {image.size}")
+                # The first photo is the one stored with the scan
+                prepared = prepared_images[0]
+                encoded_image = prepared['encoded']
             
-            except Exception as e:
-                self._send_error(400, f"Image processing failed: {str(e)}")
+            except PoolSaturatedError as e:
+                # Photos already queued would only hold pool slots
+                for future in futures:
+                    future.cancel()
+                print(f"Image pool saturated: {get_image_pool().stats()}")
+                self._send_error(503, str(e), headers={'Retry-After': str(e.retry_after)})
                 return
             
-            # Enhance and preprocess image
-            try:
-                enhanced_image = enhance_image(image)
-                processed_image = preprocess_image(enhanced_image)
-                print("Image preprocessing complete")
-            except Exception as e:
-                print(f"Enhancement failed: {str(e)}, using original")
-                processed_image = preprocess_image(image)
+            except ImageQualityError as e:
+                # The other photos' results are no longer needed
+                for future in futures:
+                    future.cancel()
+                print(f"Image {image_number} rejected by quality gate: {e.report['issues']}")
+                self._send_json_response(422, {
+                    'success': False,
+                    'error': f"Image {image_number}: {str(e)}" if len(images) > 1 else str(e),
+                    'image_index': image_number - 1,
+                    'feedback': e.report['feedback'],
+                    'image_quality': e.report,
+                    'timestamp': datetime.now().isoformat()
+                })
+                return
+            
+            except ValueError as e:
+                for future in futures:
+                    future.cancel()
+                prefix = f"Image {image_number}: " if len(images) > 1 else ""
+                self._send_error(400, f"Image processing failed: {prefix}{str(e)}")
+                return
             
             # Detect disease using Groq AI
             try:
                 if detector is None:
                     raise Exception("Groq detector not initialized")
                 
-                # Get base64 of processed image
-                from utils.image_processor import image_to_base64
-                processed_base64 = image_to_base64(processed_image)
-                
                 print("Calling Groq AI for detection...")
-                ai_result = detector.analyze_plant_image(processed_base64, crop_type)
+                ai_result = detector.analyze_plant_images(
+                    [image['encoded'].data_uri for image in prepared_images], crop_type,
+                    image_hashes=[image['image_hash'] for image in prepared_images],
+                    processing=prepared['processing']
+                )
                 
                 disease_name = ai_result.get('disease', 'Unknown')
                 confidence = ai_result.get('confidence', 0.0)
                 severity = ai_result.get('severity', 'Unknown')
                 ai_recommendation = ai_result.get('ai_recommendation', '')
                 
-                print(f"Detection result: {disease_name} ({confidence:.2%})")
+                print(f"Detection result: {disease_name} ({confidence:.2%})"
+                      f"{' [cached]' if ai_result.get('cached') else ''}")
+            
+            except RateLimitExceededError as e:
+                print(f"AI rate limit reached: {str(e)}")
+                self._send_error(429, "Too many scans right now, please try again shortly",
+                                 headers={'Retry-After': str(e.retry_after or 1)})
+                return
+            
+            except UpstreamUnavailableError as e:
+                print(f"AI service unavailable: {str(e)}")
+                self._send_error(503, "AI service is temporarily unavailable, please try again shortly",
+                                 headers={'Retry-After': str(e.retry_after or 1)})
+                return
             
             except Exception as e:
                 print(f"AI detection error: {str(e)}")
@@ -110,19 +188,13 @@ class handler(BaseHTTPRequestHandler):
             if user_id and supabase:
                 try:
                     # Upload image to Supabase Storage
-                    filename = f"{user_id}_{int(datetime.now().timestamp())}.jpg"
+                    filename = f"{user_id}_{int(datetime.now().timestamp())}.{encoded_image.extension}"
                     
-                    # Convert image to bytes
-                    import io
-                    img_byte_arr = io.BytesIO()
-                    processed_image.save(img_byte_arr, format='JPEG')
-                    img_byte_arr.seek(0)
-                    
-                    # Upload to storage
+                    # Upload the bytes already encoded for the AI call
                     storage_response = supabase.storage.from_('scan-images').upload(
                         filename,
-                        img_byte_arr.getvalue(),
-                        {"content-type": "image/jpeg"}
+                        encoded_image.data,
+                        {"content-type": encoded_image.content_type}
                     )
                     
                     # Get public URL
@@ -164,10 +236,32 @@ class handler(BaseHTTPRequestHandler):
                 'cost_estimate': disease_info.get('cost_estimate', 'Unknown'),
                 'scientific_name': disease_info.get('scientific_name', 'Unknown'),
                 'ai_recommendation': ai_recommendation,
+                'enhancement_tier': prepared['enhancement_tier'],
+                'encoding_profile': encoding_profile,
+                'image_hash': prepared['image_hash'],
+                'leaf_region': prepared['roi'],
+                'image_quality': prepared['quality'],
+                'cached': bool(ai_result.get('cached')),
+                'model': ai_result.get('model'),
+                'prompt_version': ai_result.get('prompt_version'),
+                'cascade': ai_result.get('cascade'),
+                'image_count': len(prepared_images),
                 'image_url': image_url,
                 'timestamp': datetime.now().isoformat()
             }
             
+            # Per-photo details when several photos were analyzed together
+            if len(prepared_images) > 1:
+                response_data['images'] = [
+                    {
+                        'image_hash': image['image_hash'],
+                        'leaf_region': image['roi'],
+                        'image_quality': image['quality'],
+                        'note': note
+                    }
+                    for image, note in zip(prepared_images, ai_result.get('image_notes', []))
+                ]
+            
             # Send success response
             self._send_json_response(200, response_data)
             print("Response sent successfully")
@@ -183,22 +277,24 @@ class handler(BaseHTTPRequestHandler):
         self._send_cors_headers()
         self.end_headers()
     
-    def _send_json_response(self, status_code, data):
+    def _send_json_response(self, status_code, data, headers=None):
         """Send JSON response with CORS headers"""
         self.send_response(status_code)
         self.send_header('Content-Type', 'application/json')
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
         self._send_cors_headers()
         self.end_headers()
         self.wfile.write(json.dumps(data).encode())
     
-    def _send_error(self, status_code, message):
+    def _send_error(self, status_code, message, headers=None):
         """Send error response"""
         error_data = {
             'success': False,
             'error': message,
             'timestamp': datetime.now().isoformat()
         }
-        self._send_json_response(status_code, error_data)
+        self._send_json_response(status_code, error_data, headers)
     
     def _send_cors_headers(self):
         """Send CORS headers"""
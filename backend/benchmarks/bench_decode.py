@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Decode benchmark: full decode vs reduced-scale (DCT domain) JPEG decode
+Compares decode time and peak memory of decode_base64_image with and
+without target_size, for typical phone photo resolutions.
+
+Usage:
+    python backend/benchmarks/bench_decode.py [--repeat N]
+"""
+
+import argparse
+
+from common import (PHONE_PHOTO_SIZES, create_leaf_image, encode_base64,
+                    time_call, percentile, measure_peak_rss)
+from utils.image_processor import decode_base64_image, preprocess_image, MODEL_INPUT_SIZE
+
+def decode_and_preprocess(base64_string, target_size, _warmup=False):
+    """The detect endpoint's decode + resize path, run once"""
+    if _warmup:
+        base64_string = encode_base64(create_leaf_image(160, 120))
+    image = decode_base64_image(base64_string, target_size=target_size)
+    return preprocess_image(image)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per case')
+    args = parser.parse_args()
+    
+    print("🖼️  decode_base64_image + preprocess_image")
+    print(f"{'input':>11} {'mode':>8} {'decoded':>10} {'p50 ms':>8} {'p90 ms':>8} {'peak MB':>8}")
+    
+    for width, height in PHONE_PHOTO_SIZES:
+        base64_string = encode_base64(create_leaf_image(width, height), quality=90)
+        
+        for mode, target_size in [('full', None), ('reduced', MODEL_INPUT_SIZE)]:
+            decoded = decode_base64_image(base64_string, target_size=target_size)
+            timings = time_call(lambda: decode_and_preprocess(base64_string, target_size),
+                                repeat=args.repeat)
+            peak = measure_peak_rss(decode_and_preprocess, base64_string, target_size)
+            
+            print(f"{width:>5}x{height:<5} {mode:>8} "
+                  f"{decoded.size[0]:>4}x{decoded.size[1]:<5} "
+                  f"{percentile(timings, 50) * 1000:>8.1f} "
+                  f"{percentile(timings, 90) * 1000:>8.1f} "
+                  f"{peak / (1024 * 1024):>8.1f}")
+
+if __name__ == "__main__":
+    main()
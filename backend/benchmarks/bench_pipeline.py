@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Pipeline benchmark: PIL pipeline vs NumPy-native pipeline
+Runs process_upload end to end (decode, quality gate, crop, enhance,
+resize, encode) with each IMAGE_PIPELINE implementation and compares
+latency, memory and how close the outputs are.
+
+Usage:
+    python backend/benchmarks/bench_pipeline.py [--repeat N] [--tier quality]
+"""
+
+import argparse
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from common import (PHONE_PHOTO_SIZES, create_leaf_image, encode_base64,
+                    time_call, percentile, measure_memory)
+from utils.image_processor import process_upload, IMAGE_PIPELINES
+
+def run_pipeline(image_bytes, pipeline, tier, _warmup=False):
+    """One upload through process_upload"""
+    if _warmup:
+        image_bytes = _jpeg_bytes(create_leaf_image(320, 240))
+    return process_upload(image_bytes, tier=tier, quality_gate='off', pipeline=pipeline)
+
+def _jpeg_bytes(image):
+    """Raw JPEG bytes of a PIL image"""
+    import base64
+    return base64.b64decode(encode_base64(image, quality=90).split(',')[1])
+
+def _traced_peak(fn):
+    """Peak bytes of Python and NumPy allocations (tracemalloc) during fn()"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _as_rgb(image):
+    """Processed output of either pipeline as an RGB int array"""
+    if isinstance(image, np.ndarray):
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+    return np.asarray(image).astype(np.int16)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per case')
+    parser.add_argument('--tier', default='quality', help='enhancement tier')
+    args = parser.parse_args()
+    
+    print(f"🧪 process_upload, enhancement tier '{args.tier}'")
+    print(f"{'input':>11} {'pipeline':>8} {'p50 ms':>8} {'p90 ms':>8} {'peak MB':>8} "
+          f"{'faults':>7} {'traced MB':>9} {'bytes':>6} {'diff':>5}")
+    
+    for width, height in PHONE_PHOTO_SIZES:
+        image_bytes = _jpeg_bytes(create_leaf_image(width, height))
+        reference = None
+        
+        for pipeline in IMAGE_PIPELINES:
+            result = run_pipeline(image_bytes, pipeline, args.tier)
+            output = _as_rgb(result['image'])
+            if reference is None:
+                reference = output
+            
+            timings = time_call(lambda: run_pipeline(image_bytes, pipeline, args.tier), repeat=args.repeat)
+            memory = measure_memory(run_pipeline, image_bytes, pipeline, args.tier)
+            traced = _traced_peak(lambda: run_pipeline(image_bytes, pipeline, args.tier))
+            
+            print(f"{width:>5}x{height:<5} {pipeline:>8} "
+                  f"{percentile(timings, 50) * 1000:>8.1f} "
+                  f"{percentile(timings, 90) * 1000:>8.1f} "
+                  f"{memory['peak_rss'] / (1024 * 1024):>8.1f} "
+                  f"{memory['page_faults']:>7} "
+                  f"{traced / (1024 * 1024):>9.2f} "
+                  f"{len(result['encoded']):>6} "
+                  f"{np.abs(output - reference).mean():>5.2f}")
+    
+    print("\npeak MB: peak RSS growth (all allocations, including PIL/OpenCV native buffers)")
+    print("faults: minor page faults, i.e. fresh memory pages touched (allocation traffic)")
+    print("traced MB: peak Python + NumPy allocations seen by tracemalloc")
+    print("diff: mean absolute pixel difference of the model input vs the first pipeline")
+
+if __name__ == "__main__":
+    main()
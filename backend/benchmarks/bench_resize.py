@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Resize benchmark: PIL LANCZOS vs PIL reduce+BILINEAR vs OpenCV INTER_AREA
+Resizes phone-photo sized images (and the reduced-scale decodes the
+pipeline actually sees) to the model input size with each resize backend,
+reporting latency and how close the output is to the LANCZOS reference.
+
+Usage:
+    python backend/benchmarks/bench_resize.py [--repeat N]
+"""
+
+import argparse
+
+import cv2
+import numpy as np
+
+from common import PHONE_PHOTO_SIZES, create_leaf_image, time_call, percentile
+from utils.image_processor import MODEL_INPUT_SIZE, RESIZE_BACKENDS, resize_image, resize_array
+
+def psnr(a, b):
+    """Peak signal-to-noise ratio in dB (inf for identical images)"""
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(255.0 ** 2 / mse)
+
+def ssim(a, b):
+    """Mean structural similarity of the grayscale images (Gaussian window)"""
+    a = cv2.cvtColor(a, cv2.COLOR_RGB2GRAY).astype(np.float64)
+    b = cv2.cvtColor(b, cv2.COLOR_RGB2GRAY).astype(np.float64)
+    c1, c2 = (0.01 * 255) ** 2, (0.03 * 255) ** 2
+    
+    def blur(x):
+        return cv2.GaussianBlur(x, (11, 11), 1.5)
+    
+    mu_a, mu_b = blur(a), blur(b)
+    var_a = blur(a * a) - mu_a ** 2
+    var_b = blur(b * b) - mu_b ** 2
+    cov = blur(a * b) - mu_a * mu_b
+    ssim_map = ((2 * mu_a * mu_b + c1) * (2 * cov + c2)) / ((mu_a ** 2 + mu_b ** 2 + c1) * (var_a + var_b + c2))
+    return float(ssim_map.mean())
+
+def _reduced_input(image, target_size):
+    """The image as the reduced-scale JPEG decode would hand it over"""
+    scale = 1
+    while scale < 8 and image.width // (scale * 2) >= target_size[0] and image.height // (scale * 2) >= target_size[1]:
+        scale *= 2
+    return image.reduce(scale) if scale > 1 else image
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per case')
+    args = parser.parse_args()
+    
+    print(f"🧪 Resize to {MODEL_INPUT_SIZE[0]}x{MODEL_INPUT_SIZE[1]}")
+    print(f"{'input':>11} {'decoded':>11} {'backend':>11} {'p50 ms':>8} {'PIL ms':>8} {'PSNR dB':>8} {'SSIM':>6}")
+    
+    for width, height in PHONE_PHOTO_SIZES:
+        photo = create_leaf_image(width, height)
+        
+        for source in (photo, _reduced_input(photo, MODEL_INPUT_SIZE)):
+            array = np.asarray(source)
+            reference = np.asarray(resize_image(source, MODEL_INPUT_SIZE, 'pil_lanczos'))
+            
+            for backend in RESIZE_BACKENDS:
+                output = np.asarray(resize_image(source, MODEL_INPUT_SIZE, backend))
+                pil_timings = time_call(lambda: resize_image(source, MODEL_INPUT_SIZE, backend), repeat=args.repeat)
+                array_timings = time_call(lambda: resize_array(array, MODEL_INPUT_SIZE, backend), repeat=args.repeat)
+                
+                print(f"{width:>5}x{height:<5} {source.width:>5}x{source.height:<5} {backend:>11} "
+                      f"{percentile(array_timings, 50) * 1000:>8.2f} "
+                      f"{percentile(pil_timings, 50) * 1000:>8.2f} "
+                      f"{psnr(output, reference):>8.1f} "
+                      f"{ssim(output, reference):>6.3f}")
+    
+    print("\np50 ms: resize_array on an ndarray (NumPy pipeline)")
+    print("PIL ms: resize_image on a PIL Image (PIL pipeline, includes any conversion)")
+    print("PSNR / SSIM: similarity to the pil_lanczos output of the same input")
+
+if __name__ == "__main__":
+    main()
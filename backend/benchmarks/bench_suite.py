@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+"""
+Benchmark suite for utils/image_processor
+Times decode_base64_image, validate_image, preprocess_image, enhance_image
+and image_to_base64 on synthetic JPEG, PNG, RGBA and palette uploads at
+several resolutions. Reports latency percentiles, throughput and peak
+memory, and saves everything as JSON so runs can be compared.
+
+Each function gets the input the detect endpoint would hand it: the decoded
+upload for validate/preprocess, the 224x224 model input for enhance (the
+default ENHANCE_AFTER_RESIZE order) and the enhanced image for encoding.
+
+Usage:
+    python backend/benchmarks/bench_suite.py [--repeat N] [--output run.json]
+    python backend/benchmarks/bench_suite.py --compare baseline.json
+"""
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import time
+
+import cv2
+import numpy as np
+import PIL
+
+from common import INPUT_KINDS, create_test_input, time_call, percentile, measure_memory
+from utils.image_processor import (decode_base64_image, validate_image, preprocess_image,
+                                   enhance_image, image_to_base64)
+
+# Lossless 12 MP uploads exceed MAX_IMAGE_BYTES; those cases are reported as skipped
+DEFAULT_SIZES = [(640, 480), (1280, 960), (2048, 1536), (4000, 3000)]
+
+# Pipeline order: each stage runs on the previous stage's output
+STAGES = ['decode_base64_image', 'validate_image', 'preprocess_image', 'enhance_image', 'image_to_base64']
+
+def _run_stage(name, value):
+    """Call one image_processor function the way the detect endpoint does"""
+    if name == 'decode_base64_image':
+        return decode_base64_image(value)
+    if name == 'validate_image':
+        return validate_image(value)
+    if name == 'preprocess_image':
+        return preprocess_image(value)
+    if name == 'enhance_image':
+        return enhance_image(value)
+    return image_to_base64(value)
+
+def stage_input(name, base64_string):
+    """The input a stage sees for this upload (runs the stages before it)"""
+    value = base64_string
+    for previous in STAGES[:STAGES.index(name)]:
+        if previous != 'validate_image':
+            value = _run_stage(previous, value)
+    return value
+
+def _memory_setup(name, kind, width, height):
+    """Build the stage input inside the memory worker"""
+    return (name, kind, stage_input(name, create_test_input(kind, width, height)))
+
+def run_stage(name, kind, value, _warmup=False):
+    """One call of a stage, as measured for peak memory"""
+    if _warmup:
+        value = stage_input(name, create_test_input(kind, 160, 120))
+    return _run_stage(name, value)
+
+def benchmark_case(name, kind, width, height, base64_string, repeat, memory=True):
+    """
+    Benchmark one function on one input
+    
+    Returns:
+        dict: One JSON result row
+    """
+    value = stage_input(name, base64_string)
+    timings = time_call(lambda: _run_stage(name, value), repeat=repeat)
+    mean = statistics.mean(timings)
+    
+    # Throughput in source megapixels, the unit that scales with the upload
+    megapixels = width * height / 1e6
+    row = {
+        'function': name,
+        'input': kind,
+        'format': INPUT_KINDS[kind][0],
+        'mode': INPUT_KINDS[kind][1],
+        'width': width,
+        'height': height,
+        'upload_bytes': len(base64_string),
+        'repeat': repeat,
+        'p50_ms': percentile(timings, 50) * 1000,
+        'p90_ms': percentile(timings, 90) * 1000,
+        'p99_ms': percentile(timings, 99) * 1000,
+        'mean_ms': mean * 1000,
+        'ops_per_s': 1 / mean if mean else None,
+        'mpix_per_s': megapixels / mean if mean else None,
+        'peak_rss_mb': None,
+        'page_faults': None,
+    }
+    
+    if memory:
+        usage = measure_memory(run_stage, name, kind, width, height, setup=_memory_setup)
+        row['peak_rss_mb'] = usage['peak_rss'] / (1024 * 1024)
+        row['page_faults'] = usage['page_faults']
+    return row
+
+def _environment():
+    """Versions and machine details stored with every run"""
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': sys.version.split()[0],
+        'pillow': PIL.__version__,
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+    }
+
+def _case_key(row):
+    return (row['function'], row['input'], row['width'], row['height'])
+
+def compare(rows, baseline_path):
+    """Print the p50 change of every case against a saved run"""
+    with open(baseline_path) as f:
+        baseline = {_case_key(row): row for row in json.load(f)['results']}
+    
+    print(f"\n📊 p50 vs {baseline_path}")
+    print(f"{'function':>20} {'input':>8} {'size':>11} {'before':>8} {'after':>8} {'change':>8}")
+    for row in rows:
+        before = baseline.get(_case_key(row))
+        if before is None:
+            continue
+        change = (row['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0.0
+        print(f"{row['function']:>20} {row['input']:>8} {row['width']:>5}x{row['height']:<5} "
+              f"{before['p50_ms']:>8.2f} {row['p50_ms']:>8.2f} {change:>+7.1f}%")
+
+def _parse_sizes(value):
+    return [tuple(int(n) for n in size.split('x')) for size in value.split(',')]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per case')
+    parser.add_argument('--sizes', type=_parse_sizes, default=DEFAULT_SIZES,
+                        help='comma-separated WIDTHxHEIGHT list (default 640x480,1280x960,2048x1536,4000x3000)')
+    parser.add_argument('--inputs', default=','.join(INPUT_KINDS),
+                        help=f"comma-separated input kinds (default {','.join(INPUT_KINDS)})")
+    parser.add_argument('--functions', default=','.join(STAGES), help='comma-separated functions to run')
+    parser.add_argument('--no-memory', action='store_true', help='skip the (slower) peak memory runs')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='JSON file of an earlier run to compare p50 against')
+    args = parser.parse_args()
+    
+    kinds = args.inputs.split(',')
+    functions = args.functions.split(',')
+    for name in functions:
+        if name not in STAGES:
+            parser.error(f"unknown function {name} (expected one of {', '.join(STAGES)})")
+    for kind in kinds:
+        if kind not in INPUT_KINDS:
+            parser.error(f"unknown input {kind} (expected one of {', '.join(INPUT_KINDS)})")
+    
+    print(f"🧪 image_processor suite, {args.repeat} runs per case")
+    print(f"{'function':>20} {'input':>8} {'size':>11} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} "
+          f"{'ops/s':>8} {'MP/s':>7} {'peak MB':>8}")
+    
+    rows = []
+    for width, height in args.sizes:
+        for kind in kinds:
+            base64_string = create_test_input(kind, width, height)
+            for name in functions:
+                try:
+                    row = benchmark_case(name, kind, width, height, base64_string, args.repeat,
+                                         memory=not args.no_memory)
+                except ValueError as e:
+                    # e.g. a 12 MP PNG is over MAX_IMAGE_BYTES, as it would be in production
+                    print(f"{name:>20} {kind:>8} {width:>5}x{height:<5} skipped: {e}")
+                    continue
+                rows.append(row)
+                peak = f"{row['peak_rss_mb']:>8.1f}" if row['peak_rss_mb'] is not None else f"{'-':>8}"
+                print(f"{name:>20} {kind:>8} {width:>5}x{height:<5} {row['p50_ms']:>8.2f} "
+                      f"{row['p90_ms']:>8.2f} {row['p99_ms']:>8.2f} {row['ops_per_s']:>8.1f} "
+                      f"{row['mpix_per_s']:>7.1f} {peak}")
+    
+    print("\nMP/s: source megapixels per second; peak MB: peak RSS growth of one call")
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'environment': _environment(), 'results': rows}, f, indent=2)
+        print(f"💾 Results saved to {args.output}")
+    
+    if args.compare:
+        compare(rows, args.compare)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+"""
+Shared helpers for the image pipeline benchmarks
+Synthetic leaf photos, timing and peak-memory measurement
+"""
+
+import os
+import sys
+import io
+import base64
+import time
+import math
+import multiprocessing
+
+# Add backend directory to path for imports
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from PIL import Image, ImageDraw
+
+# Common phone camera resolutions (width, height)
+PHONE_PHOTO_SIZES = [
+    (1280, 960),
+    (2048, 1536),
+    (3264, 2448),
+    (4000, 3000),
+]
+
+def create_leaf_image(width, height, seed=0):
+    """
+    Create a leaf-like test photo: a green leaf with spots on a soil background
+    
+    Args:
+        width: Image width in pixels
+        height: Image height in pixels
+        seed: Seed for the sensor noise, so runs are reproducible
+        
+    Returns:
+        PIL Image in RGB mode
+    """
+    import numpy as np
+    
+    img = Image.new('RGB', (width, height), color=(110, 82, 60))  # Soil
+    draw = ImageDraw.Draw(img)
+    
+    # Leaf body and midrib
+    draw.ellipse([width * 0.15, height * 0.1, width * 0.85, height * 0.9],
+                 fill=(52, 128, 44), outline=(30, 80, 25), width=max(1, width // 200))
+    draw.line([width * 0.2, height * 0.5, width * 0.8, height * 0.5],
+              fill=(120, 170, 90), width=max(1, width // 150))
+    
+    # Lesions
+    for i in range(12):
+        cx = width * (0.25 + 0.05 * i)
+        cy = height * (0.3 + 0.04 * (i % 5) * (1 if i % 2 else -1) + 0.2)
+        r = max(2, width // 60)
+        draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=(95, 70, 30))
+    
+    # Sensor noise so JPEG compression sees photo-like content
+    rng = np.random.default_rng(seed)
+    pixels = np.asarray(img, dtype=np.int16)
+    pixels = pixels + rng.integers(-12, 13, size=pixels.shape, dtype=np.int16)
+    return Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8))
+
+# Upload kinds the clients produce: (format, PIL mode)
+INPUT_KINDS = {
+    'jpeg': ('JPEG', 'RGB'),
+    'png': ('PNG', 'RGB'),
+    'rgba': ('PNG', 'RGBA'),
+    'palette': ('PNG', 'P'),
+}
+
+def create_test_input(kind, width, height, seed=0):
+    """
+    Create a synthetic upload of the given kind
+    
+    Args:
+        kind: Key of INPUT_KINDS - jpeg, png, rgba (transparent background)
+            or palette (256-colour adaptive palette)
+        width: Image width in pixels
+        height: Image height in pixels
+        seed: Seed for the sensor noise
+        
+    Returns:
+        str: Data URI, like the mobile and web clients send
+    """
+    format, mode = INPUT_KINDS[kind]
+    img = create_leaf_image(width, height, seed)
+    
+    if mode == 'RGBA':
+        # Cut the leaf out: everything outside the leaf ellipse is transparent
+        alpha = Image.new('L', (width, height), 0)
+        ImageDraw.Draw(alpha).ellipse([width * 0.15, height * 0.1, width * 0.85, height * 0.9], fill=255)
+        img.putalpha(alpha)
+    elif mode == 'P':
+        img = img.convert('P', palette=Image.ADAPTIVE, colors=256)
+    
+    if format == 'JPEG':
+        return encode_base64(img, format, quality=90)
+    return encode_base64(img, format)
+
+def encode_base64(image, format='JPEG', **save_kwargs):
+    """Encode a PIL image as a data URI, like the mobile and web clients send"""
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **save_kwargs)
+    img_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
+    return f"data:image/{format.lower()};base64,{img_base64}"
+
+def time_call(fn, repeat=10, warmup=1):
+    """
+    Time repeated calls of fn
+    
+    Returns:
+        list: Per-call latencies in seconds
+    """
+    for _ in range(warmup):
+        fn()
+    
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    rank = math.ceil(pct / 100 * len(ordered))
+    return ordered[max(0, min(len(ordered), rank) - 1)]
+
+def _proc_status(field):
+    """A memory field of /proc/self/status in bytes, or None off Linux"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+def _reset_peak_rss():
+    """
+    Reset the peak RSS to the current RSS (Linux 4.0+)
+    
+    Returns:
+        int or None: The current RSS in bytes, or None if the peak can't be reset
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        return None
+    return _proc_status('VmRSS')
+
+def _peak_rss():
+    """Peak resident set size of this process in bytes"""
+    # VmHWM is reset on exec; ru_maxrss is inherited from the parent on Linux
+    peak = _proc_status('VmHWM')
+    if peak is not None:
+        return peak
+    
+    import resource
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+def _memory_worker(target, args, conn, setup=None):
+    """Run target(*args) in a fresh process and report its memory use"""
+    import resource
+    
+    if setup is not None:
+        args = setup(*args)
+    target(*args, _warmup=True)
+    # Measure from the current RSS, so earlier peaks (setup) don't hide the call's
+    before = _reset_peak_rss()
+    if before is None:
+        before = _peak_rss()
+    faults_before = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    target(*args)
+    conn.send({
+        'peak_rss': _peak_rss() - before,
+        'page_faults': resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults_before
+    })
+    conn.close()
+
+def measure_memory(target, *args, setup=None):
+    """
+    Measure the memory a call needs
+    
+    target is called in a freshly spawned interpreter, once with
+    _warmup=True (imports, lazy initialisation) and once for real. Native
+    buffers allocated by PIL and OpenCV are included, unlike tracemalloc.
+    
+    Args:
+        target: Module-level function accepting *args and a _warmup keyword
+        args: Arguments passed to target
+        setup: Optional module-level function run in the child first; its
+            return value (a tuple) replaces args, so building the inputs is
+            not counted as part of the call
+        
+    Returns:
+        dict: peak_rss (peak RSS growth in bytes) and page_faults (minor
+            page faults, i.e. freshly allocated pages touched - a proxy for
+            allocation traffic that peak RSS doesn't show)
+    """
+    ctx = multiprocessing.get_context('spawn')
+    parent_conn, child_conn = ctx.Pipe(duplex=False)
+    process = ctx.Process(target=_memory_worker, args=(target, args, child_conn, setup))
+    process.start()
+    child_conn.close()
+    try:
+        result = parent_conn.recv()
+    except EOFError:
+        raise RuntimeError(f"Benchmark worker for {target.__name__} failed")
+    finally:
+        process.join()
+    return result
+
+def measure_peak_rss(target, *args):
+    """Peak RSS growth in bytes of one call of target (see measure_memory)"""
+    return measure_memory(target, *args)['peak_rss']
@@ -7,9 +7,6 @@ This script helps you test the API endpoints locally before deploying to Vercel
 import os
 import sys
 import json
-import base64
-from io import BytesIO
-from PIL import Image
 import requests
 
 # Add the current directory to Python path
@@ -19,17 +16,9 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from api import health, detect, diseases, history
 
 def create_test_image():
-    """Create a simple test image for testing"""
-    # Create a simple green image (simulating a leaf)
-    img = Image.new('RGB', (224, 224), color=(34, 139, 34))  # Forest green
-    
-    # Convert to base64
-    buffer = BytesIO()
-    img.save(buffer, format='JPEG')
-    img_bytes = buffer.getvalue()
-    img_base64 = base64.b64encode(img_bytes).decode('utf-8')
-    
-    return f"data:image/jpeg;base64,{img_base64}"
+    """Create a leaf-like test photo (the benchmarks' generator) as a JPEG data URI"""
+    from benchmarks.common import create_test_input
+    return create_test_input('jpeg', 224, 224)
 
 def test_health_endpoint():
     """Test the health endpoint"""
@@ -111,6 +100,27 @@ def test_image_processing():
     
     return True
 
+def test_quality_gate():
+    """Test that transparent leaf cut-outs pass the quality gate"""
+    print("\n🔍 Testing Quality Gate...")
+    
+    try:
+        from benchmarks.common import create_test_input
+        from utils.image_processor import process_upload, IMAGE_PIPELINES
+        
+        # The white a cut-out is composited on must not count as overexposure
+        rgba_image = create_test_input('rgba', 1280, 960)
+        for pipeline in IMAGE_PIPELINES:
+            result = process_upload(rgba_image, quality_gate='reject', pipeline=pipeline)
+            print(f"✅ RGBA cut-out passes the {pipeline} pipeline's gate "
+                  f"(brightness {result['quality']['brightness']}, clipped {result['quality']['clipped_bright']})")
+        
+    except Exception as e:
+        print(f"❌ Quality gate test failed: {e}")
+        return False
+    
+    return True
+
 def test_groq_client():
     """Test Groq client (requires API key)"""
     print("\n🤖 Testing Groq Client...")
@@ -190,6 +200,7 @@ def main():
         test_health_endpoint,
         test_disease_database,
         test_image_processing,
+        test_quality_gate,
         test_groq_client,
     ]
     
@@ -4,111 +4,574 @@ Uses Groq's vision model to analyze plant images
 """
 
 import os
-from groq import Groq
-import json
+from groq import Groq, AsyncGroq, APIStatusError, BadRequestError
+import hashlib
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+
+from .image_processor import EncodedImage, encode_image
+from .result_cache import get_result_cache, make_cache_key
+from .single_flight import SingleFlight, AsyncSingleFlight
+from .response_parser import StreamingFieldExtractor, parse_detection_response
+from .prompts import get_prompt_registry
+from .resilience import (RetryPolicy, CircuitBreaker, HedgePolicy, UpstreamUnavailableError,
+                         GROQ_HEDGE, GROQ_HEDGE_MODEL, call_with_retry, async_call_with_retry, hedged_call, async_hedged_call,
+                         get_retry_after)
+from .rate_limiter import get_rate_limiter, rate_limiter_stats, GROQ_IMAGE_TOKENS
+from .http_pool import pool_limits, GROQ_MAX_CONNECTIONS
+
+# Upstream calls the async detector allows in flight at once
+GROQ_MAX_IN_FLIGHT = int(os.getenv('GROQ_MAX_IN_FLIGHT', '32'))
+
+# Seconds an async analysis may take, including the wait for a free slot
+GROQ_TIMEOUT = float(os.getenv('GROQ_TIMEOUT', '30'))
+
+# Cascade: ask the small model first and escalate to the large one only
+# when its answer is unsure (confidence below the threshold) or unidentified
+GROQ_CASCADE = os.getenv('GROQ_CASCADE', 'false').lower() in ('1', 'true', 'yes', 'on')
+GROQ_SMALL_MODEL = os.getenv('GROQ_SMALL_MODEL', 'llama-3.2-11b-vision-preview')
+GROQ_CASCADE_THRESHOLD = float(os.getenv('GROQ_CASCADE_THRESHOLD', '0.8'))
+
+# Small-model answers that always escalate
+CASCADE_ESCALATE_DISEASES = ('unknown', 'analysis error')
+
+# Streaming: read the completion as it is generated and stop it as soon as
+# these fields are complete, instead of waiting for the whole answer
+GROQ_STREAM = os.getenv('GROQ_STREAM', 'false').lower() in ('1', 'true', 'yes', 'on')
+GROQ_STREAM_STOP_FIELDS = tuple(
+    field.strip() for field in os.getenv('GROQ_STREAM_STOP_FIELDS', 'disease_detected,confidence,severity').split(',')
+    if field.strip()
+)
+
+# JSON mode: ask for a bare JSON object (response_format json_object) with a
+# tight schema (prompts.JSON_MODE_SUFFIX), which needs far fewer tokens than
+# the free-form answer
+GROQ_JSON_MODE = os.getenv('GROQ_JSON_MODE', 'true').lower() in ('1', 'true', 'yes', 'on')
+GROQ_MAX_TOKENS = int(os.getenv('GROQ_MAX_TOKENS', '1000'))
+GROQ_JSON_MAX_TOKENS = int(os.getenv('GROQ_JSON_MAX_TOKENS', '300'))
+
+# Photos of one plant accepted in a single analysis, sent together in one
+# completion; each extra photo adds room for its note to the token limit
+GROQ_MAX_IMAGES = int(os.getenv('GROQ_MAX_IMAGES', '5'))
+IMAGE_NOTE_TOKENS = 40
 
 class GroqDiseaseDetector:
     """Client for Groq AI plant disease detection"""
     
-    def __init__(self):
-        """Initialize Groq client"""
+    def __init__(self, encoding_profile=None, cache=None, http_client=None, cascade=None, stream=None,
+                 json_mode=None):
+        """
+        Initialize Groq client
+        
+        Prefer get_detector(), which shares one detector (and its
+        connection pool) across the whole process.
+        
+        Args:
+            encoding_profile: Encoding profile for images passed as PIL
+                Images, or None for the deployment default
+            cache: ResultCache for analyses, or None for the process-wide
+                cache (disabled with RESULT_CACHE=false)
+            http_client: httpx.Client to send requests with, or None for a
+                keep-alive pool sized by GROQ_MAX_CONNECTIONS
+            cascade: Try GROQ_SMALL_MODEL first and escalate on doubt; None
+                uses GROQ_CASCADE
+            stream: Stream completions and stop at GROQ_STREAM_STOP_FIELDS;
+                None uses GROQ_STREAM
+            json_mode: Request a strict JSON object answer; None uses
+                GROQ_JSON_MODE
+        """
+        api_key = self._init_common(encoding_profile, cache, cascade, stream, json_mode)
+        
+        if http_client is None:
+            http_client = httpx.Client(limits=pool_limits())
+        # Retries are done by call_with_retry, so the circuit breaker sees every attempt
+        self.client = Groq(api_key=api_key, http_client=http_client, max_retries=0)
+        self._flights = SingleFlight()
+        self._hedge_executor = None
+        if self.hedge is not None:
+            self._hedge_executor = ThreadPoolExecutor(max_workers=GROQ_MAX_CONNECTIONS,
+                                                      thread_name_prefix='groq-hedge')
+    
+    def _init_common(self, encoding_profile, cache, cascade, stream, json_mode):
+        """
+        Settings shared by the sync and async detectors (everything but the
+        client and the coalescing)
+        
+        Returns:
+            str: The Groq API key
+        
+        Raises:
+            ValueError: If GROQ_API_KEY is not set
+        """
         api_key = os.getenv('GROQ_API_KEY')
         if not api_key:
             raise ValueError("GROQ_API_KEY environment variable not set")
         
-        self.client = Groq(api_key=api_key)
         self.model = "llama-3.2-90b-vision-preview"  # Groq's vision model
+        self.encoding_profile = encoding_profile
+        self.cache = cache if cache is not None else get_result_cache()
+        self._init_resilience()
+        self._init_cascade(cascade)
+        if self.hedge is not None and self.cascade and self.hedge.model == self.small_model:
+            # A hedged small-model answer would skip the cascade's confidence check
+            print(f"Hedge model {self.hedge.model} is the cascade's small model, hedging to {self.model} instead")
+            self.hedge.model = self.model
+        self.stream = GROQ_STREAM if stream is None else stream
+        self.stream_stop_fields = GROQ_STREAM_STOP_FIELDS
+        self.json_mode = GROQ_JSON_MODE if json_mode is None else json_mode
+        self.prompts = get_prompt_registry()
+        return api_key
     
-    def analyze_plant_image(self, base64_image, crop_type="unknown"):
+    def _init_resilience(self):
+        """Retry policy, circuit breakers and (with GROQ_HEDGE) hedging"""
+        self.retry_policy = RetryPolicy()
+        self.breakers = {}
+        self._breakers_lock = threading.Lock()
+        self.hedge = HedgePolicy(GROQ_HEDGE_MODEL or self.model) if GROQ_HEDGE else None
+    
+    def _breaker(self, model):
+        """Circuit breaker of a model, created on first use"""
+        # Groq serves each model separately: one failing model mustn't block the others
+        breaker = self.breakers.get(model)
+        if breaker is None:
+            with self._breakers_lock:
+                breaker = self.breakers.setdefault(model, CircuitBreaker())
+        return breaker
+    
+    def _init_cascade(self, cascade=None):
+        """Small-model-first cascade settings and decision counters"""
+        self.cascade = GROQ_CASCADE if cascade is None else cascade
+        self.small_model = GROQ_SMALL_MODEL
+        self.cascade_threshold = GROQ_CASCADE_THRESHOLD
+        self._cascade_lock = threading.Lock()
+        self._cascade_counts = {'accepted': 0, 'low_confidence': 0, 'unidentified': 0, 'error': 0}
+    
+    def analyze_plant_image(self, base64_image, crop_type="unknown", image_hash=None, processing=None):
         """
         Analyze plant image for diseases using Groq Vision AI
         
+        Results are cached by a digest of the encoded image, the
+        preprocessing settings, crop type, model and prompt version; a
+        cached result is returned with 'cached' set to True.
+        With a PROMPT_VARIANT set, the prompt version is picked per image.
+        Concurrent calls for the same image and crop share one upstream
+        call while it is in flight.
+        
         Args:
-            base64_image: Base64 encoded image string
+            base64_image: Base64 encoded image string, EncodedImage, or PIL
+                Image (encoded with the detector's encoding profile)
             crop_type: Type of crop (tomato, potato, etc.)
+            image_hash: Perceptual hash of the upload, so near-identical
+                photos get the same prompt variant; None uses the digest
+            processing: Preprocessing settings of the image (process_upload's
+                'processing'), part of the cache key
             
         Returns:
             dict: Detection results with disease, confidence, and recommendations
+            
+        Raises:
+            UpstreamUnavailableError: If Groq is down or rate limiting after
+                the retries, or the circuit breaker is open (has retry_after)
         """
-        try:
-            # Prepare the prompt
-            prompt = self._create_analysis_prompt(crop_type)
-            
-            # Ensure proper data URI format
-            if not base64_image.startswith('data:image'):
-                base64_image = f"data:image/jpeg;base64,{base64_image}"
-            
-            # Call Groq API
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "user",
-                        "content": [
-                            {
-                                "type": "text",
-                                "text": prompt
-                            },
-                            {
-                                "type": "image_url",
-                                "image_url": {
-                                    "url": base64_image
-                                }
-                            }
-                        ]
-                    }
-                ],
-                temperature=0.2,  # Lower temperature for more consistent results
-                max_tokens=1000,
-                top_p=0.9
-            )
+        return self.analyze_plant_images([base64_image], crop_type, [image_hash], processing)
+    
+    def analyze_plant_images(self, images, crop_type="unknown", image_hashes=None, processing=None):
+        """
+        Analyze several photos of one plant in a single upstream call
+        
+        The photos are sent together and the model answers with one
+        diagnosis based on all of them; with more than one photo the result
+        also has 'image_notes', a short note per photo in order. Caching and
+        coalescing work as in analyze_plant_image, keyed by every photo.
+        
+        Args:
+            images: Up to GROQ_MAX_IMAGES base64 strings, EncodedImages or
+                PIL Images
+            crop_type: Type of crop (tomato, potato, etc.)
+            image_hashes: Perceptual hash of each photo (entries may be
+                None), or None to use the digests
+            processing: Preprocessing settings of the photos
+            
+        Returns:
+            dict: Detection results, as from analyze_plant_image
             
-            # Parse response
-            result_text = response.choices[0].message.content
+        Raises:
+            ValueError: If there are no photos, more than GROQ_MAX_IMAGES,
+                or a hash count that doesn't match
+            UpstreamUnavailableError: If Groq is down or rate limiting after
+                the retries, or the circuit breaker is open (has retry_after)
+        """
+        self._check_images(images, image_hashes)
+        try:
+            # Encode images that haven't been encoded yet
+            image_uris = []
+            for image in images:
+                if not isinstance(image, (str, EncodedImage)):
+                    image = encode_image(image, profile=self.encoding_profile)
+                image_uris.append(self._to_data_uri(image))
             
-            # Extract structured data from response
-            result = self._parse_analysis_result(result_text, crop_type)
+            prompt, request_key = self._prepare_request(image_uris, crop_type, image_hashes, processing)
+            cached = self._cached_result(request_key)
+            if cached is not None:
+                return cached
             
-            return result
+            # Identical requests already in flight (double taps, client retries) share its call
+            result, shared = self._flights.do(request_key, lambda: self._analyze(image_uris, prompt, request_key))
+            return dict(result) if shared else result
+        
+        except UpstreamUnavailableError as e:
+            print(f"Groq API unavailable: {str(e)}")
+            raise
         
         except Exception as e:
             print(f"Groq API error: {str(e)}")
             raise Exception(f"Disease detection failed: {str(e)}")
     
-    def _create_analysis_prompt(self, crop_type):
-        """Create prompt for disease analysis"""
-        crop_display = crop_type.title() if crop_type and crop_type.lower() != 'unknown' else 'plant'
+    def stats(self):
+        """Circuit breaker, coalescing, hedging, prompt and rate limit counters"""
+        with self._breakers_lock:
+            breakers = dict(self.breakers)
+        stats = {'circuit': {model: breaker.stats() for model, breaker in breakers.items()},
+                 'single_flight': self._flights.stats(),
+                 'prompts': self.prompts.stats(), 'rate_limits': rate_limiter_stats()}
+        if self.hedge is not None:
+            stats['hedge'] = self.hedge.stats()
+        if self.cascade:
+            with self._cascade_lock:
+                stats['cascade'] = dict(self._cascade_counts)
+        return stats
+    
+    def _check_images(self, images, image_hashes=None):
+        """Validate the photos of one analysis"""
+        if not images:
+            raise ValueError("No images to analyze")
+        if len(images) > GROQ_MAX_IMAGES:
+            raise ValueError(f"Too many images: {len(images)} (at most {GROQ_MAX_IMAGES} per analysis)")
+        if image_hashes is not None and len(image_hashes) != len(images):
+            raise ValueError("Expected one image hash per image")
+    
+    def _to_data_uri(self, base64_image):
+        """Data URI for a base64 string or EncodedImage"""
+        if isinstance(base64_image, EncodedImage):
+            return base64_image.data_uri
         
-        return f"""You are an expert plant pathologist. Analyze this {crop_display} image and identify any diseases.
-
-Provide your analysis in the following JSON format:
-{{
-    "disease_detected": "name of disease or 'Healthy Plant'",
-    "confidence": confidence score between 0 and 1,
-    "severity": "None/Mild/Moderate/Severe",
-    "symptoms_observed": ["list", "of", "symptoms"],
-    "recommendation": "brief treatment recommendation"
-}}
-
-For {crop_display}, look for common diseases including:
-- Fungal diseases (spots, blights, molds, rusts)
-- Bacterial diseases (lesions, wilts, spots)
-- Viral diseases (mosaic patterns, yellowing, deformities)
-- Nutrient deficiencies (chlorosis, necrosis)
-- Pest damage (holes, discoloration)
-- Environmental stress (burning, wilting)
-
-Focus on visible symptoms like:
-- Leaf discoloration, spots, or patterns
-- Leaf curling, wilting, or deformity
-- Mold, fungal growth, or unusual textures
-- Stem or branch lesions
-- Overall plant health and vigor
-- Any unusual growths or discolorations
-
-Be specific about the disease name and provide practical treatment recommendations. 
-If the plant looks healthy, respond with "Healthy Plant".
-If you cannot identify a specific disease, describe the symptoms and suggest "Unknown Disease - Consult Expert"."""
+        # Ensure proper data URI format
+        if not base64_image.startswith('data:image'):
+            return f"data:image/jpeg;base64,{base64_image}"
+        return base64_image
+    
+    def _analyze(self, image_uris, prompt, request_key):
+        """Call Groq API (small model first when cascading) and parse the answer"""
+        decision = None
+        if self.cascade:
+            try:
+                result = self._parse_result(self._complete(image_uris, prompt, self.small_model),
+                                            prompt, self.small_model)
+            except Exception as e:
+                # Including an open small-model circuit: the large model has its own
+                result = None
+                print(f"Small model failed, escalating: {str(e)}")
+            
+            decision = self._cascade_decision(result)
+            if not decision['escalated']:
+                result['cascade'] = decision
+                return self._store_result(result, request_key)
+        
+        if self.hedge is None:
+            result_text, model = self._complete(image_uris, prompt, self.model), self.model
+        else:
+            result_text, hedged = hedged_call(
+                lambda: self._complete(image_uris, prompt, self.model),
+                lambda: self._complete(image_uris, prompt, self.hedge.model),
+                self.hedge, self._hedge_executor, self._breaker(self.hedge.model)
+            )
+            model = self.hedge.model if hedged else self.model
+        
+        # Parse response
+        result = self._parse_result(result_text, prompt, model)
+        if decision is not None:
+            result['cascade'] = decision
+        return self._store_result(result, request_key)
+    
+    def _cascade_decision(self, result):
+        """
+        Decide whether the small model's answer is good enough
+        
+        Args:
+            result: Parsed small-model result, or None if the call failed
+            
+        Returns:
+            dict: small_model, small_disease, small_confidence, escalated
+                and reason (accepted, low_confidence, unidentified or error)
+        """
+        if result is None:
+            reason = 'error'
+        elif result['disease'].lower().startswith(CASCADE_ESCALATE_DISEASES):
+            reason = 'unidentified'
+        elif result['confidence'] < self.cascade_threshold:
+            reason = 'low_confidence'
+        else:
+            reason = 'accepted'
+        
+        with self._cascade_lock:
+            self._cascade_counts[reason] += 1
+        
+        decision = {
+            'small_model': self.small_model,
+            'small_disease': result['disease'] if result else None,
+            'small_confidence': result['confidence'] if result else None,
+            'threshold': self.cascade_threshold,
+            'escalated': reason != 'accepted',
+            'reason': reason
+        }
+        if decision['escalated']:
+            print(f"Cascade: escalating to {self.model} ({reason}, "
+                  f"small model said {decision['small_disease']} at {decision['small_confidence']})")
+        return decision
+    
+    def _complete(self, image_uris, prompt, model):
+        """One completion with retries, through the circuit breaker and rate limiter"""
+        def attempt():
+            request = self._completion_request(image_uris, prompt, model)
+            limiter = get_rate_limiter(model)
+            reserved = limiter.acquire(self._estimate_tokens(request, prompt)) if limiter else 0
+            
+            start = time.perf_counter()
+            try:
+                if self.stream:
+                    result_text = self._stream_completion(request, limiter, reserved)
+                else:
+                    result_text = self._create_completion(request, limiter, reserved)
+            except Exception as e:
+                self._observe_error(limiter, e, reserved)
+                raise
+            self._record_latency(model, time.perf_counter() - start)
+            return result_text
+        
+        return call_with_retry(attempt, self.retry_policy, self._breaker(model))
+    
+    def _create_completion(self, request, limiter=None, reserved=0):
+        """Completion text of a non-streamed call"""
+        try:
+            raw = self.client.chat.completions.with_raw_response.create(**request)
+        except BadRequestError as e:
+            result_text = self._failed_generation(e)
+            self._observe_unmetered(limiter, reserved, request, result_text, e.response.headers)
+            return result_text
+        response = raw.parse()
+        self._observe_response(limiter, raw.headers, reserved, response.usage)
+        return response.choices[0].message.content
+    
+    def _stream_completion(self, request, limiter=None, reserved=0):
+        """
+        Stream a completion, stopping once the stop fields are complete
+        
+        Returns:
+            str: The JSON object up to the last complete field, or the full
+                text if it never contained one
+        """
+        extractor = StreamingFieldExtractor()
+        raw = self.client.chat.completions.with_raw_response.create(stream=True, **request)
+        stream = raw.parse()
+        usage = None
+        try:
+            for chunk in stream:
+                usage = self._chunk_usage(chunk) or usage
+                if self._feed_chunk(extractor, chunk):
+                    break
+        finally:
+            # Closing the connection early stops generation upstream
+            stream.close()
+        self._observe_stream(limiter, reserved, request, extractor, raw.headers, usage)
+        return self._streamed_text(extractor)
+    
+    def _chunk_usage(self, chunk):
+        """Usage Groq reports on the last chunk of a stream, or None"""
+        x_groq = getattr(chunk, 'x_groq', None)
+        return getattr(x_groq, 'usage', None)
+    
+    def _feed_chunk(self, extractor, chunk):
+        """Add a streamed chunk; True once the answer has what we need"""
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            return False
+        extractor.feed(chunk.choices[0].delta.content)
+        return extractor.complete or extractor.has_fields(self.stream_stop_fields)
+    
+    def _streamed_text(self, extractor):
+        """Text to parse for a streamed answer"""
+        if not extractor.complete and extractor.has_fields(self.stream_stop_fields):
+            print(f"Stream stopped early after {len(extractor.text)} characters")
+        return extractor.partial_json() if extractor.fields else extractor.text
+    
+    def _failed_generation(self, error):
+        """
+        Answer of a JSON mode request the API rejected as invalid JSON
+        
+        Groq returns the rejected text with the error; the tolerant parser
+        usually recovers the fields from it (e.g. an answer cut off by
+        max_tokens).
+        
+        Raises:
+            BadRequestError: If the error carries no generated text
+        """
+        body = error.body if isinstance(error.body, dict) else {}
+        body = body.get('error', body) if isinstance(body.get('error'), dict) else body
+        failed_generation = body.get('failed_generation')
+        if not self.json_mode or not failed_generation:
+            raise error
+        print("JSON mode answer rejected upstream, parsing the failed generation")
+        return failed_generation
+    
+    def _estimate_tokens(self, request, prompt):
+        """Tokens a call may use, reserved from the rate limit up front"""
+        return prompt.tokens + GROQ_IMAGE_TOKENS * prompt.images + request['max_tokens']
+    
+    def _observe_response(self, limiter, headers, reserved=0, usage=None):
+        """Feed the rate limiter a response's rate-limit headers and usage"""
+        if limiter is None:
+            return
+        # Settle first: the remaining counts in the headers already include this call
+        if usage is not None:
+            limiter.settle(reserved, usage.total_tokens)
+        limiter.update(headers)
+    
+    def _observe_stream(self, limiter, reserved, request, extractor, headers, usage=None):
+        """Settle a streamed call: with its usage if it ran to the end, else estimated"""
+        if usage is not None:
+            self._observe_response(limiter, headers, reserved, usage)
+        else:
+            # A stream stopped early reports no usage
+            self._observe_unmetered(limiter, reserved, request, extractor.text, headers)
+    
+    def _observe_unmetered(self, limiter, reserved, request, text, headers):
+        """
+        Settle a call that reported no usage, counting its answer at four
+        characters per token and the rest of its reservation as prompt
+        """
+        if limiter is None:
+            return
+        used = max(0, reserved - request['max_tokens']) + len(text) // 4
+        limiter.settle(reserved, used)
+        limiter.update(headers)
+    
+    def _observe_error(self, limiter, error, reserved=0):
+        """Give a failed call's budget back and feed the limiter its headers; a 429 pauses it"""
+        if limiter is None:
+            return
+        # Released before the headers are applied, which already leave this call out
+        limiter.release(reserved)
+        if isinstance(error, APIStatusError):
+            limiter.update(error.response.headers)
+            if error.status_code == 429:
+                limiter.pause(get_retry_after(error) or 1)
+    
+    def _record_latency(self, model, seconds):
+        """Primary model latencies set the hedging delay"""
+        if self.hedge is not None and model == self.model:
+            self.hedge.latency.record(seconds)
+    
+    def _prepare_request(self, image_uris, crop_type, image_hashes=None, processing=None):
+        """
+        Prompt for an analysis, and its identity for the result cache and
+        coalescing
+        
+        The identity is a digest of exactly the bytes the model sees. The
+        perceptual hashes only pick the prompt variant, so near-identical
+        photos land in the same arm without sharing a diagnosis.
+        
+        Returns:
+            tuple: (Prompt, request key)
+        """
+        digests = [hashlib.sha256(image_uri.encode()).hexdigest() for image_uri in image_uris]
+        hashes = [
+            image_hash or digest
+            for digest, image_hash in zip(digests, image_hashes or [None] * len(image_uris))
+        ]
+        # Several photos are keyed together, in order, since the notes follow it
+        content_digest = digests[0] if len(digests) == 1 else hashlib.sha256('|'.join(digests).encode()).hexdigest()
+        image_hash = hashes[0] if len(hashes) == 1 else hashlib.sha256('|'.join(hashes).encode()).hexdigest()
+        prompt = self.prompts.select(crop_type, image_hash, self.json_mode, len(image_uris))
+        return prompt, make_cache_key(content_digest, crop_type, self._model_key(), self._answer_key(prompt),
+                                      processing)
+    
+    def _answer_key(self, prompt):
+        """Prompt part of the request key: streamed answers stop early, so are kept apart"""
+        if self.stream:
+            return f"{prompt.version}-stream-{'+'.join(self.stream_stop_fields)}"
+        return prompt.version
+    
+    def _model_key(self):
+        """Model part of the request key: a cascade may answer with either model"""
+        if self.cascade:
+            return f"{self.small_model}>{self.model}@{self.cascade_threshold}"
+        return self.model
+    
+    def _cached_result(self, request_key):
+        """Cached result marked as such, or None on a miss"""
+        if self.cache is None:
+            return None
+        cached = self.cache.get(request_key)
+        if cached is not None:
+            cached['cached'] = True
+        return cached
+    
+    def _completion_request(self, image_uris, prompt, model=None):
+        """Keyword arguments of the chat completion call"""
+        max_tokens = GROQ_JSON_MAX_TOKENS if self.json_mode else GROQ_MAX_TOKENS
+        request = {
+            'model': model or self.model,
+            'messages': [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt.text
+                        }
+                    ] + [
+                        {
+                            "type": "image_url",
+                            "image_url": {
+                                "url": image_uri
+                            }
+                        }
+                        for image_uri in image_uris
+                    ]
+                }
+            ],
+            'temperature': 0.2,  # Lower temperature for more consistent results
+            'max_tokens': max_tokens + IMAGE_NOTE_TOKENS * (len(image_uris) - 1),
+            'top_p': 0.9
+        }
+        # Groq's JSON mode doesn't stream; streamed answers still get the tight prompt
+        if self.json_mode and not self.stream:
+            request['response_format'] = {"type": "json_object"}
+        return request
+    
+    def _parse_result(self, result_text, prompt, model=None):
+        """Parse the model's answer, noting which model and prompt gave it"""
+        # Extract structured data from response
+        result = self._parse_analysis_result(result_text, prompt.crop_type)
+        result['model'] = model or self.model
+        result['prompt_version'] = prompt.version
+        if prompt.images > 1:
+            # One note per photo, even if the model gave too few or too many
+            notes = result.get('image_notes', [])
+            result['image_notes'] = (notes + [''] * prompt.images)[:prompt.images]
+        return result
+    
+    def _store_result(self, result, request_key):
+        """Cache a finished result"""
+        # Unparseable answers are worth another try, so only cache real results
+        if self.cache is not None and result['disease'] != 'Analysis Error':
+            self.cache.set(request_key, result)
+        
+        result['cached'] = False
+        return result
     
     def _parse_analysis_result(self, result_text, crop_type):
         """
@@ -122,45 +585,9 @@ If you cannot identify a specific disease, describe the symptoms and suggest "Un
             dict: Structured detection result
         """
         try:
-            # Try to extract JSON from response
-            # Look for JSON block in markdown code blocks
-            if "```json" in result_text:
-                json_start = result_text.find("```json") + 7
-                json_end = result_text.find("```", json_start)
-                json_text = result_text[json_start:json_end].strip()
-            elif "```" in result_text:
-                json_start = result_text.find("```") + 3
-                json_end = result_text.find("```", json_start)
-                json_text = result_text[json_start:json_end].strip()
-            elif "{" in result_text and "}" in result_text:
-                json_start = result_text.find("{")
-                json_end = result_text.rfind("}") + 1
-                json_text = result_text[json_start:json_end]
-            else:
-                json_text = result_text
-            
-            # Parse JSON
-            data = json.loads(json_text)
-            
-            # Validate and normalize
-            disease = data.get('disease_detected', 'Unknown').strip()
-            confidence = float(data.get('confidence', 0.5))
-            severity = data.get('severity', 'Unknown')
-            symptoms = data.get('symptoms_observed', [])
-            recommendation = data.get('recommendation', '')
-            
-            # Ensure confidence is between 0 and 1
-            if confidence > 1:
-                confidence = confidence / 100
-            
-            return {
-                'disease': disease,
-                'confidence': confidence,
-                'severity': 'Unknown',
-                'symptoms': [],
-                'ai_recommendation': result_text[:200],
-                'raw_response': result_text
-            }
+            result = parse_detection_response(result_text or '')
+            result['raw_response'] = result_text
+            return result
         
         except Exception as e:
             print(f"Parse error: {str(e)}")
@@ -171,4 +598,246 @@ If you cannot identify a specific disease, describe the symptoms and suggest "Un
                 'symptoms': [],
                 'ai_recommendation': 'Failed to analyze image',
                 'raw_response': result_text
-            }
\ No newline at end of file
+            }
+
+_detector = None
+_detector_lock = threading.Lock()
+
+def get_detector():
+    """
+    Get the process-wide detector, creating it on first use
+    
+    Every entry point shares it, so scans reuse pooled connections instead
+    of opening a new one (TCP + TLS handshake) per request.
+    
+    Raises:
+        ValueError: If GROQ_API_KEY is not set
+    """
+    global _detector
+    if _detector is None:
+        with _detector_lock:
+            if _detector is None:
+                _detector = GroqDiseaseDetector()
+    return _detector
+
+class DetectionTimeoutError(Exception):
+    """Raised when an analysis doesn't finish within its timeout"""
+
+class AsyncGroqDiseaseDetector(GroqDiseaseDetector):
+    """asyncio client for Groq AI plant disease detection"""
+    
+    def __init__(self, encoding_profile=None, cache=None, max_in_flight=GROQ_MAX_IN_FLIGHT,
+                 timeout=GROQ_TIMEOUT, http_client=None, cascade=None, stream=None, json_mode=None):
+        """
+        Initialize the async Groq client
+        
+        Args:
+            encoding_profile: Encoding profile for images passed as PIL
+                Images, or None for the deployment default
+            cache: ResultCache for analyses, or None for the process-wide cache
+            max_in_flight: Upstream calls allowed at once; further calls
+                wait for a slot
+            timeout: Default seconds per analysis, or None for no limit
+            http_client: httpx.AsyncClient to send requests with, or None
+                for a keep-alive pool sized by GROQ_MAX_CONNECTIONS
+            cascade: Try GROQ_SMALL_MODEL first and escalate on doubt; None
+                uses GROQ_CASCADE
+            stream: Stream completions and stop at GROQ_STREAM_STOP_FIELDS;
+                None uses GROQ_STREAM
+            json_mode: Request a strict JSON object answer; None uses
+                GROQ_JSON_MODE
+        """
+        api_key = self._init_common(encoding_profile, cache, cascade, stream, json_mode)
+        
+        if http_client is None:
+            http_client = httpx.AsyncClient(limits=pool_limits())
+        self.client = AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        self._semaphore = None
+        self._in_flight = 0
+        self._flights = AsyncSingleFlight()
+    
+    async def analyze_plant_image(self, base64_image, crop_type="unknown", image_hash=None, timeout=None,
+                                  processing=None):
+        """
+        Analyze plant image for diseases using Groq Vision AI
+        
+        Concurrent calls for the same image and crop share one upstream
+        call. Cancelling the task cancels the upstream request and frees its
+        slot, once no other caller is waiting on it.
+        
+        Args:
+            base64_image: Base64 encoded image string, EncodedImage, or PIL
+                Image (encoded with the detector's encoding profile)
+            crop_type: Type of crop (tomato, potato, etc.)
+            image_hash: Perceptual hash of the upload, for the prompt variant
+            timeout: Seconds for this call, or None for the detector default
+            processing: Preprocessing settings of the image, for the result cache
+            
+        Returns:
+            dict: Detection results with disease, confidence, and recommendations
+            
+        Raises:
+            DetectionTimeoutError: If the analysis took longer than timeout
+            UpstreamUnavailableError: If Groq is down or rate limiting after
+                the retries, or the circuit breaker is open
+        """
+        return await self.analyze_plant_images([base64_image], crop_type, [image_hash], timeout, processing)
+    
+    async def analyze_plant_images(self, images, crop_type="unknown", image_hashes=None, timeout=None,
+                                   processing=None):
+        """
+        Analyze several photos of one plant in a single upstream call
+        
+        See GroqDiseaseDetector.analyze_plant_images; cancellation and
+        timeouts work as in analyze_plant_image.
+        
+        Args:
+            images: Up to GROQ_MAX_IMAGES base64 strings, EncodedImages or
+                PIL Images
+            crop_type: Type of crop (tomato, potato, etc.)
+            image_hashes: Perceptual hash of each photo, or None
+            timeout: Seconds for this call, or None for the detector default
+            processing: Preprocessing settings of the photos
+            
+        Returns:
+            dict: Detection results, as from analyze_plant_image
+            
+        Raises:
+            ValueError: If there are no photos or too many
+            DetectionTimeoutError: If the analysis took longer than timeout
+            UpstreamUnavailableError: If Groq is down or rate limiting after
+                the retries, or the circuit breaker is open
+        """
+        self._check_images(images, image_hashes)
+        
+        # Encoding is CPU work, keep it off the event loop
+        image_uris = []
+        for image in images:
+            if not isinstance(image, (str, EncodedImage)):
+                image = await asyncio.to_thread(encode_image, image, profile=self.encoding_profile)
+            image_uris.append(self._to_data_uri(image))
+        
+        prompt, request_key = self._prepare_request(image_uris, crop_type, image_hashes, processing)
+        cached = self._cached_result(request_key)
+        if cached is not None:
+            return cached
+        
+        timeout = self.timeout if timeout is None else timeout
+        try:
+            result, shared = await asyncio.wait_for(
+                self._flights.do(request_key, lambda: self._analyze(image_uris, prompt, request_key)),
+                timeout
+            )
+        except asyncio.TimeoutError:
+            print(f"Groq API timeout after {timeout}s")
+            raise DetectionTimeoutError(f"Disease detection timed out after {timeout}s")
+        except UpstreamUnavailableError as e:
+            print(f"Groq API unavailable: {str(e)}")
+            raise
+        except Exception as e:
+            print(f"Groq API error: {str(e)}")
+            raise Exception(f"Disease detection failed: {str(e)}")
+        
+        return dict(result) if shared else result
+    
+    async def _analyze(self, image_uris, prompt, request_key):
+        """Run the completion (small model first when cascading) and parse the answer"""
+        decision = None
+        if self.cascade:
+            try:
+                result = self._parse_result(await self._complete(image_uris, prompt, self.small_model),
+                                            prompt, self.small_model)
+            except Exception as e:
+                # Including an open small-model circuit: the large model has its own
+                result = None
+                print(f"Small model failed, escalating: {str(e)}")
+            
+            decision = self._cascade_decision(result)
+            if not decision['escalated']:
+                result['cascade'] = decision
+                return self._store_result(result, request_key)
+        
+        if self.hedge is None:
+            result_text, model = await self._complete(image_uris, prompt, self.model), self.model
+        else:
+            result_text, hedged = await async_hedged_call(
+                lambda: self._complete(image_uris, prompt, self.model),
+                lambda: self._complete(image_uris, prompt, self.hedge.model),
+                self.hedge, self._breaker(self.hedge.model)
+            )
+            model = self.hedge.model if hedged else self.model
+        
+        result = self._parse_result(result_text, prompt, model)
+        if decision is not None:
+            result['cascade'] = decision
+        return self._store_result(result, request_key)
+    
+    async def _complete(self, image_uris, prompt, model):
+        """One completion with retries; each attempt waits for rate budget, then a slot"""
+        # Created lazily so the detector can be built outside the event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        
+        async def attempt():
+            request = self._completion_request(image_uris, prompt, model)
+            limiter = get_rate_limiter(model)
+            reserved = await limiter.async_acquire(self._estimate_tokens(request, prompt)) if limiter else 0
+            
+            # Opened before the slot wait, so a cancel or timeout there gives the budget back too
+            try:
+                async with self._semaphore:
+                    self._in_flight += 1
+                    start = time.perf_counter()
+                    try:
+                        if self.stream:
+                            result_text = await self._stream_completion(request, limiter, reserved)
+                        else:
+                            result_text = await self._create_completion(request, limiter, reserved)
+                    finally:
+                        self._in_flight -= 1
+            except (Exception, asyncio.CancelledError) as e:
+                self._observe_error(limiter, e, reserved)
+                raise
+            self._record_latency(model, time.perf_counter() - start)
+            return result_text
+        
+        return await async_call_with_retry(attempt, self.retry_policy, self._breaker(model))
+    
+    async def _create_completion(self, request, limiter=None, reserved=0):
+        """Completion text of a non-streamed call"""
+        try:
+            raw = await self.client.chat.completions.with_raw_response.create(**request)
+        except BadRequestError as e:
+            result_text = self._failed_generation(e)
+            self._observe_unmetered(limiter, reserved, request, result_text, e.response.headers)
+            return result_text
+        response = await raw.parse()
+        self._observe_response(limiter, raw.headers, reserved, response.usage)
+        return response.choices[0].message.content
+    
+    async def _stream_completion(self, request, limiter=None, reserved=0):
+        """Stream a completion, stopping once the stop fields are complete"""
+        extractor = StreamingFieldExtractor()
+        raw = await self.client.chat.completions.with_raw_response.create(stream=True, **request)
+        stream = await raw.parse()
+        usage = None
+        try:
+            async for chunk in stream:
+                usage = self._chunk_usage(chunk) or usage
+                if self._feed_chunk(extractor, chunk):
+                    break
+        finally:
+            # Closing the connection early stops generation upstream
+            await stream.close()
+        self._observe_stream(limiter, reserved, request, extractor, raw.headers, usage)
+        return self._streamed_text(extractor)
+    
+    def stats(self):
+        """Upstream calls in flight, for logging and health checks"""
+        return dict(super().stats(), in_flight=self._in_flight, max_in_flight=self.max_in_flight)
+    
+    async def aclose(self):
+        """Close the underlying HTTP connections"""
+        await self.client.close()
@@ -0,0 +1,23 @@
+"""
+Groq HTTP Connection Pool
+Keep-alive pool limits shared by every Groq client, in the backend and in
+the standalone Vercel function
+"""
+
+import os
+
+import httpx
+
+# HTTP connection pool shared by every call of a client. Kept-alive
+# connections skip the TCP and TLS handshakes on later scans.
+GROQ_MAX_CONNECTIONS = int(os.getenv('GROQ_MAX_CONNECTIONS', '20'))
+GROQ_MAX_KEEPALIVE = int(os.getenv('GROQ_MAX_KEEPALIVE', '10'))
+GROQ_KEEPALIVE_EXPIRY = float(os.getenv('GROQ_KEEPALIVE_EXPIRY', '60'))
+
+def pool_limits():
+    """Connection pool limits for a Groq HTTP client"""
+    return httpx.Limits(
+        max_connections=GROQ_MAX_CONNECTIONS,
+        max_keepalive_connections=GROQ_MAX_KEEPALIVE,
+        keepalive_expiry=GROQ_KEEPALIVE_EXPIRY
+    )
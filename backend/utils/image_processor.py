@@ -5,31 +5,173 @@ Handles image preprocessing for disease detection
 
 from PIL import Image
 import io
+import os
+import functools
 import base64
 import cv2
 import numpy as np
 
-def decode_base64_image(base64_string):
+# Size the vision model input is resized to
+MODEL_INPUT_SIZE = (224, 224)
+
+# Resize backends for the model input:
+#   pil_lanczos - PIL LANCZOS, the highest quality and the slowest
+#   pil_reduce  - PIL reduce() by the integer factor, then BILINEAR for the rest
+#   cv2_area    - OpenCV INTER_AREA (pixel-area averaging)
+# Unset, each pipeline uses its native backend (pil_lanczos / cv2_area).
+RESIZE_BACKENDS = ('pil_lanczos', 'pil_reduce', 'cv2_area')
+DEFAULT_RESIZE_BACKEND = os.getenv('RESIZE_BACKEND', '').lower() or None
+
+# Enhancement tiers, cheapest first:
+#   off     - no enhancement
+#   fast    - CLAHE contrast equalization only
+#   quality - CLAHE followed by non-local means denoising
+ENHANCEMENT_TIERS = ('off', 'fast', 'quality')
+DEFAULT_ENHANCEMENT_TIER = os.getenv('ENHANCEMENT_TIER', 'quality').lower()
+
+# Enhance the resized model input instead of the full-size upload
+ENHANCE_AFTER_RESIZE = os.getenv('ENHANCE_AFTER_RESIZE', 'true').lower() in ('1', 'true', 'yes')
+
+# Per-channel RGB mean and std used to normalize float model input (ImageNet)
+NORMALIZE_MEAN = np.array([0.485, 0.456, 0.406], dtype=np.float32)
+NORMALIZE_STD = np.array([0.229, 0.224, 0.225], dtype=np.float32)
+
+# Output encoding profiles for the processed image sent to the vision
+# model and to storage. 'target_kb' binary-searches the quality setting
+# for the largest file that fits the budget.
+ENCODING_PROFILES = {
+    'default': {'format': 'JPEG'},
+    'high': {'format': 'JPEG', 'quality': 90},
+    'compact': {'format': 'JPEG', 'quality': 60, 'optimize': True},
+    'webp': {'format': 'WEBP', 'quality': 75},
+    'target': {'format': 'JPEG', 'target_kb': int(os.getenv('IMAGE_TARGET_KB', 8)), 'optimize': True},
+}
+DEFAULT_ENCODING_PROFILE = os.getenv('IMAGE_ENCODING_PROFILE', 'default').lower()
+
+# Quality range searched by target_kb encoding
+MIN_ENCODING_QUALITY = 30
+MAX_ENCODING_QUALITY = 95
+
+# Crop to the plant tissue (vegetation mask bounding box) before resizing
+LEAF_ROI_CROP = os.getenv('LEAF_ROI_CROP', 'true').lower() in ('1', 'true', 'yes')
+ROI_PADDING = float(os.getenv('ROI_PADDING', '0.1'))  # Fraction of the box size added on each side
+ROI_MASK_SIZE = 128  # Long side of the thumbnail the mask is computed on
+ROI_MIN_COVERAGE = 0.02  # Below this fraction of plant pixels, keep the full frame
+
+# With the leaf crop on, uploads are decoded at this many times the model
+# input size, so a leaf filling 1/ROI_DECODE_SCALE of the frame side still
+# gives a crop at full model input resolution
+ROI_DECODE_SCALE = float(os.getenv('ROI_DECODE_SCALE', '4'))
+
+# Image quality gate, run before enhancement and the AI call:
+#   reject - unusable photos are refused with feedback
+#   flag   - the quality report is returned but analysis continues
+#   off    - no quality check
+QUALITY_GATE_MODES = ('reject', 'flag', 'off')
+DEFAULT_QUALITY_GATE = os.getenv('QUALITY_GATE', 'reject').lower()
+QUALITY_SAMPLE_SIZE = 256  # Long side of the thumbnail the metrics are computed on
+MIN_SHARPNESS = float(os.getenv('MIN_SHARPNESS', '25'))  # Variance of the Laplacian
+MIN_BRIGHTNESS = float(os.getenv('MIN_BRIGHTNESS', '35'))  # Mean luma, 0-255
+MAX_BRIGHTNESS = float(os.getenv('MAX_BRIGHTNESS', '225'))
+MIN_CONTRAST = float(os.getenv('MIN_CONTRAST', '5'))  # Luma standard deviation
+MAX_CLIPPED_FRACTION = 0.35  # Pixels at pure black or pure white
+
+# Perceptual hash returned with every preprocessing result ('dhash' or 'phash')
+IMAGE_HASH_ALGORITHM = os.getenv('IMAGE_HASH_ALGORITHM', 'dhash').lower()
+IMAGE_HASH_SIZE = 8
+
+# Image pipeline implementation:
+#   pil   - PIL images throughout (decode, crop, resize, encode), OpenCV for enhancement
+#   numpy - bytes are decoded straight into a BGR ndarray with cv2.imdecode and
+#           stay there, with in-place OpenCV operations, until cv2.imencode
+IMAGE_PIPELINES = ('pil', 'numpy')
+DEFAULT_IMAGE_PIPELINE = os.getenv('IMAGE_PIPELINE', 'pil').lower()
+
+# PIL's default JPEG quality, used by the numpy pipeline when the encoding
+# profile doesn't set one so both pipelines produce the same output
+DEFAULT_JPEG_QUALITY = 75
+
+# Upload limits, checked against the file header before any pixels are decoded
+MAX_IMAGE_BYTES = int(os.getenv('MAX_IMAGE_BYTES', 10 * 1024 * 1024))
+MAX_IMAGE_PIXELS = int(os.getenv('MAX_IMAGE_PIXELS', 5000 * 5000))
+MIN_IMAGE_DIMENSION = 100
+MAX_IMAGE_DIMENSION = 5000
+ALLOWED_FORMATS = ('JPEG', 'MPO', 'PNG', 'WEBP', 'BMP', 'GIF')
+SUPPORTED_MODES = ('RGB', 'RGBA', 'L', 'LA', 'P', 'CMYK', '1', 'I', 'I;16', 'I;16B', 'I;16L')
+HIGH_BIT_DEPTH_MODES = ('I', 'I;16', 'I;16B', 'I;16L')  # 16-bit grayscale PNGs (and TIFF-like integer data)
+
+# Decompression bomb guard for any other Image.open in the process
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+def probe_image(image_bytes):
     """
-    Decode base64 image string to PIL Image
-    Supports JPEG, PNG, and other common formats
+    Read only the container header of an encoded image
+    
+    No pixel data is decoded, so this is cheap even for huge or hostile
+    uploads.
     
     Args:
-        base64_string: Base64 encoded image string
+        image_bytes: Encoded image bytes
         
     Returns:
-        PIL Image object
+        dict: width, height, mode, format and bytes (encoded size)
     """
+    image = _open_image(image_bytes)
+    return _probe_from_open_image(image, image_bytes)
+
+def _open_image(image_bytes):
+    """Open encoded bytes lazily (header only)"""
     try:
-        # Remove data URL prefix if present
-        if ',' in base64_string:
-            base64_string = base64_string.split(',')[1]
-        
-        # Decode base64
-        image_bytes = base64.b64decode(base64_string)
+        return Image.open(io.BytesIO(image_bytes))
+    except Exception as e:
+        raise ValueError(f"Unrecognized image data: {str(e)}")
+
+def _probe_from_open_image(image, image_bytes):
+    """Build the probe dict for an image opened with _open_image"""
+    width, height = image.size
+    return {
+        'width': width,
+        'height': height,
+        'mode': image.mode,
+        'format': image.format,
+        'bytes': len(image_bytes)
+    }
+
+def decode_image_bytes(image_bytes, target_size=None):
+    """
+    Decode encoded image bytes to an RGB PIL Image
+    
+    The header is probed and checked with validate_image first, so uploads
+    that are too large, too small or in an unsupported format are rejected
+    before any pixel buffer is allocated.
+    
+    When target_size is given, JPEG images are decoded at a reduced scale
+    (1/2, 1/4 or 1/8) in the DCT domain, so the full-resolution pixel buffer
+    is never allocated. The decoded image is still at least target_size in
+    both dimensions, so preprocess_image only ever shrinks it.
+    
+    Args:
+        image_bytes: Encoded image bytes (JPEG, PNG, WebP, ...)
+        target_size: Optional size tuple (width, height) the image will be
+            resized to afterwards
         
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(image_bytes))
+    Returns:
+        PIL Image object. image.info['original_size'] holds the size
+        stored in the file, before any reduced-scale decoding, and
+        image.info['alpha'] the alpha channel of a transparent upload.
+    """
+    image = _open_image(image_bytes)
+    probe = _probe_from_open_image(image, image_bytes)
+    
+    is_valid, error_msg = validate_image(probe)
+    if not is_valid:
+        raise ValueError(f"Invalid image: {error_msg}")
+    
+    try:
+        # Let the JPEG decoder downscale while decoding. draft() is a no-op
+        # for formats that don't support it.
+        if target_size is not None:
+            image.draft('RGB', target_size)
         
         # Ensure we can handle all common formats
         # Convert to RGB if needed (handles JPEG, PNG, etc.)
@@ -38,23 +180,145 @@ def decode_base64_image(base64_string):
             rgb_image = Image.new('RGB', image.size, (255, 255, 255))
             if image.mode == 'P':
                 image = image.convert('RGBA')
-            rgb_image.paste(image, mask=image.split()[-1] if image.mode in ['RGBA', 'LA'] else None)
+            alpha = image.split()[-1]
+            rgb_image.paste(image, mask=alpha)
+            if alpha.getextrema()[0] < 255:
+                # Kept so the quality gate can leave the white background out
+                rgb_image.info['alpha'] = alpha
             image = rgb_image
+        elif image.mode in HIGH_BIT_DEPTH_MODES:
+            # convert() would clip everything above 255 to white: scale to 8 bits instead
+            gray = (np.asarray(image).astype(np.uint32) >> 8).clip(0, 255).astype(np.uint8)
+            image = Image.fromarray(gray, 'L').convert('RGB')
         elif image.mode != 'RGB':
             image = image.convert('RGB')
+        else:
+            image.load()
+        
+        image.info['original_size'] = (probe['width'], probe['height'])
         
         return image
     
     except Exception as e:
         raise ValueError(f"Failed to decode image: {str(e)}")
 
-def preprocess_image(image, target_size=(224, 224)):
+def base64_to_bytes(base64_string):
+    """
+    Decode a base64 string or data URI to raw bytes
+    
+    The encoded length is checked against MAX_IMAGE_BYTES before decoding.
+    
+    Args:
+        base64_string: Base64 encoded image string, with or without a
+            data URL prefix
+        
+    Returns:
+        bytes: Decoded image bytes
+    """
+    # Remove data URL prefix if present
+    if ',' in base64_string:
+        base64_string = base64_string.split(',')[1]
+    
+    if len(base64_string) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ValueError(f"Invalid image: Image file too large (maximum {MAX_IMAGE_BYTES // (1024 * 1024)} MB)")
+    
+    try:
+        return base64.b64decode(base64_string)
+    except Exception as e:
+        raise ValueError(f"Failed to decode image: {str(e)}")
+
+def decode_base64_image(base64_string, target_size=None):
+    """
+    Decode base64 image string to PIL Image
+    Supports JPEG, PNG, and other common formats
+    
+    Args:
+        base64_string: Base64 encoded image string
+        target_size: Optional size tuple (width, height) the image will be
+            resized to afterwards, enables reduced-scale JPEG decoding
+        
+    Returns:
+        PIL Image object (see decode_image_bytes)
+    """
+    return decode_image_bytes(base64_to_bytes(base64_string), target_size)
+
+def get_resize_backend(requested=None, native='pil_lanczos'):
+    """
+    Resolve which resize backend to use
+    
+    Args:
+        requested: Backend name, or None for the deployment default
+            (RESIZE_BACKEND environment variable)
+        native: Backend used when neither is set
+        
+    Returns:
+        str: One of RESIZE_BACKENDS
+    """
+    backend = (requested or DEFAULT_RESIZE_BACKEND or native).lower()
+    if backend not in RESIZE_BACKENDS:
+        raise ValueError(f"Unknown resize backend: {backend} (expected one of {', '.join(RESIZE_BACKENDS)})")
+    return backend
+
+def _pil_reduce_resize(image, target_size):
+    """Integer-factor box reduce, then BILINEAR for the remaining scale"""
+    width, height = image.size
+    factor_x = max(1, width // target_size[0])
+    factor_y = max(1, height // target_size[1])
+    if factor_x > 1 or factor_y > 1:
+        image = image.reduce((factor_x, factor_y))
+    return image.resize(target_size, Image.BILINEAR)
+
+def resize_image(image, target_size=MODEL_INPUT_SIZE, backend=None):
+    """
+    Resize a PIL Image with the selected backend
+    
+    Args:
+        image: PIL Image object
+        target_size: Target size tuple (width, height)
+        backend: Name in RESIZE_BACKENDS, or None for the default
+        
+    Returns:
+        Resized PIL Image
+    """
+    backend = get_resize_backend(backend, native='pil_lanczos')
+    if backend == 'pil_lanczos':
+        return image.resize(target_size, Image.LANCZOS)
+    if backend == 'pil_reduce':
+        return _pil_reduce_resize(image, target_size)
+    resized = cv2.resize(_to_rgb_array(image), target_size, interpolation=cv2.INTER_AREA)
+    return Image.fromarray(resized)
+
+def resize_array(array, target_size=MODEL_INPUT_SIZE, backend=None, dst=None):
+    """
+    Resize an ndarray with the selected backend
+    
+    Args:
+        array: uint8 ndarray (any channel order)
+        target_size: Target size tuple (width, height)
+        backend: Name in RESIZE_BACKENDS, or None for the default
+        dst: Optional preallocated output array
+        
+    Returns:
+        Resized ndarray (dst when given)
+    """
+    backend = get_resize_backend(backend, native='cv2_area')
+    if backend == 'cv2_area':
+        return cv2.resize(array, target_size, dst=dst, interpolation=cv2.INTER_AREA)
+    
+    resized = np.asarray(resize_image(Image.fromarray(np.ascontiguousarray(array)), target_size, backend))
+    if dst is None:
+        return resized
+    np.copyto(dst, resized)
+    return dst
+
+def preprocess_image(image, target_size=MODEL_INPUT_SIZE, resize_backend=None):
     """
     Preprocess image for ML model
     
     Args:
         image: PIL Image object
         target_size: Target size tuple (width, height)
+        resize_backend: Name in RESIZE_BACKENDS, or None for the default
         
     Returns:
         Preprocessed PIL Image
@@ -65,7 +329,7 @@ def preprocess_image(image, target_size=(224, 224)):
             image = image.convert('RGB')
         
         # Resize image
-        image = image.resize(target_size, Image.LANCZOS)
+        image = resize_image(image, target_size, resize_backend)
         
         # Optional: Enhance image quality
         # You can add contrast, brightness adjustments here
@@ -75,16 +339,36 @@ def preprocess_image(image, target_size=(224, 224)):
     except Exception as e:
         raise ValueError(f"Failed to preprocess image: {str(e)}")
 
-def enhance_image(image):
+def get_enhancement_tier(requested=None):
+    """
+    Resolve which enhancement tier to run
+    
+    Args:
+        requested: Per-request tier override, or None for the deployment
+            default (ENHANCEMENT_TIER environment variable)
+        
+    Returns:
+        str: One of ENHANCEMENT_TIERS
+    """
+    tier = (requested or DEFAULT_ENHANCEMENT_TIER).lower()
+    if tier not in ENHANCEMENT_TIERS:
+        raise ValueError(f"Unknown enhancement tier: {tier} (expected one of {', '.join(ENHANCEMENT_TIERS)})")
+    return tier
+
+def enhance_image(image, tier='quality'):
     """
     Enhance image quality using OpenCV
     
     Args:
         image: PIL Image object
+        tier: Enhancement tier ('off', 'fast' or 'quality')
         
     Returns:
         Enhanced PIL Image
     """
+    if tier == 'off':
+        return image
+    
     try:
         # Convert PIL to OpenCV format
         img_array = np.array(image)
@@ -100,8 +384,9 @@ def enhance_image(image):
         enhanced = cv2.merge([l, a, b])
         enhanced = cv2.cvtColor(enhanced, cv2.COLOR_LAB2BGR)
         
-        # Denoise
-        enhanced = cv2.fastNlMeansDenoisingColored(enhanced, None, 10, 10, 7, 21)
+        # Denoise (the expensive step, quality tier only)
+        if tier == 'quality':
+            enhanced = cv2.fastNlMeansDenoisingColored(enhanced, None, 10, 10, 7, 21)
         
         # Convert back to PIL
         enhanced_rgb = cv2.cvtColor(enhanced, cv2.COLOR_BGR2RGB)
@@ -113,12 +398,519 @@ def enhance_image(image):
         print(f"Enhancement failed, returning original: {str(e)}")
         return image
 
+def prepare_image(image, target_size=MODEL_INPUT_SIZE, tier=None, enhance_after_resize=None, crop_roi=None,
+                  resize_backend=None):
+    """
+    Crop, enhance and resize a decoded upload into the model input
+    
+    Args:
+        image: Decoded PIL Image
+        target_size: Model input size tuple (width, height)
+        tier: Enhancement tier override, or None for the deployment default
+        enhance_after_resize: Enhance the resized image rather than the
+            original; None uses ENHANCE_AFTER_RESIZE
+        crop_roi: Crop to the leaf region first; None uses LEAF_ROI_CROP
+        resize_backend: Name in RESIZE_BACKENDS, or None for the default
+        
+    Returns:
+        dict: 'image' (preprocessed PIL Image), 'enhancement_tier' (the
+            tier that ran), 'image_hash' (perceptual hash of the upload)
+            and 'roi' (leaf box as fractions of the frame, or None)
+    """
+    tier = get_enhancement_tier(tier)
+    image_hash = perceptual_hash(image)
+    if enhance_after_resize is None:
+        enhance_after_resize = ENHANCE_AFTER_RESIZE
+    if crop_roi is None:
+        crop_roi = LEAF_ROI_CROP
+    
+    roi = None
+    if crop_roi:
+        image, roi = crop_to_leaf(image, target_size)
+    
+    if enhance_after_resize:
+        processed = enhance_image(preprocess_image(image, target_size, resize_backend), tier)
+    else:
+        processed = preprocess_image(enhance_image(image, tier), target_size, resize_backend)
+    
+    return {
+        'image': processed,
+        'enhancement_tier': tier,
+        'image_hash': image_hash,
+        'roi': roi
+    }
+
+def _to_rgb_array(image):
+    """
+    View a decoded image as a NumPy array without converting its channels
+    
+    PIL images in modes other than RGB/RGBA/L are converted to RGB first;
+    arrays are passed through unchanged.
+    """
+    if isinstance(image, np.ndarray):
+        return image
+    if image.mode not in ('RGB', 'RGBA', 'L'):
+        image = image.convert('RGB')
+    return np.asarray(image)
+
+def _composite_on_white(array):
+    """
+    Composite a 4-channel uint8 array (RGBA or BGRA) on white, as the
+    decoders do with transparent uploads
+    
+    Returns:
+        New 3-channel uint8 array in the same channel order
+    """
+    # 255 - (255 - color) * alpha / 255
+    alpha = cv2.merge([array[..., 3]] * 3)
+    color = cv2.bitwise_not(array[..., :3])
+    cv2.multiply(color, alpha, dst=color, scale=1 / 255)
+    return cv2.bitwise_not(color, dst=color)
+
+def preprocess_batch(images, target_size=MODEL_INPUT_SIZE, dtype=np.uint8, normalize=False, out=None):
+    """
+    Preprocess many decoded images into a single (N, H, W, 3) NumPy array
+    
+    Each image is resized straight into its slot of one preallocated
+    array, then channel conversion and scaling run on the small images
+    (conversion per slot, scaling once over the whole batch).
+    
+    Args:
+        images: Sequence of decoded images - PIL Images, or uint8 arrays
+            shaped (H, W), (H, W, 3) RGB or (H, W, 4) RGBA; transparent
+            areas are composited on white, as in decode_image_bytes
+        target_size: Target size tuple (width, height)
+        dtype: np.uint8 for raw pixels, np.float32 for values in [0, 1]
+        normalize: For float32 output, also subtract NORMALIZE_MEAN and
+            divide by NORMALIZE_STD
+        out: Optional preallocated (N, H, W, 3) array of dtype to fill
+        
+    Returns:
+        numpy.ndarray of shape (N, H, W, 3)
+    """
+    dtype = np.dtype(dtype)
+    if dtype not in (np.uint8, np.float32):
+        raise ValueError(f"Unsupported batch dtype: {dtype}")
+    if normalize and dtype != np.float32:
+        raise ValueError("normalize requires dtype=np.float32")
+    
+    width, height = target_size
+    shape = (len(images), height, width, 3)
+    if out is not None and (out.shape != shape or out.dtype != dtype):
+        raise ValueError(f"out must have shape {shape} and dtype {dtype}")
+    
+    if dtype == np.uint8:
+        pixels = out if out is not None else np.empty(shape, dtype=np.uint8)
+    else:
+        pixels = np.empty(shape, dtype=np.uint8)
+    
+    try:
+        for i, image in enumerate(images):
+            if isinstance(image, Image.Image) and (image.mode in ('LA', 'PA') or
+                                                   (image.mode == 'P' and 'transparency' in image.info)):
+                image = image.convert('RGBA')
+            array = _to_rgb_array(image)
+            if array.ndim == 3 and array.shape[2] == 4:
+                # Transparent areas become white, as in decode_image_bytes
+                array = _composite_on_white(array)
+            
+            if array.ndim == 3:
+                cv2.resize(array, target_size, dst=pixels[i], interpolation=cv2.INTER_AREA)
+            else:
+                small = cv2.resize(array, target_size, interpolation=cv2.INTER_AREA)
+                cv2.cvtColor(small, cv2.COLOR_GRAY2RGB, dst=pixels[i])
+    
+    except Exception as e:
+        raise ValueError(f"Failed to preprocess batch: {str(e)}")
+    
+    if dtype == np.uint8:
+        return pixels
+    
+    batch = out if out is not None else np.empty(shape, dtype=np.float32)
+    np.multiply(pixels, np.float32(1 / 255), out=batch)
+    if normalize:
+        batch -= NORMALIZE_MEAN
+        batch /= NORMALIZE_STD
+    return batch
+
+def _to_gray_array(image, bgr=False):
+    """Grayscale uint8 array of a PIL Image or RGB/RGBA/gray (or BGR) array"""
+    array = _to_rgb_array(image)
+    if array.ndim == 2:
+        return array
+    if bgr:
+        code = cv2.COLOR_BGR2GRAY if array.shape[2] == 3 else cv2.COLOR_BGRA2GRAY
+    else:
+        code = cv2.COLOR_RGB2GRAY if array.shape[2] == 3 else cv2.COLOR_RGBA2GRAY
+    return cv2.cvtColor(array, code)
+
+def _bits_to_hex(bits):
+    """Pack a boolean array (..., n) into hex strings, one per leading index"""
+    packed = np.packbits(bits.reshape(bits.shape[0], -1), axis=1)
+    return [row.tobytes().hex() for row in packed]
+
+@functools.lru_cache(maxsize=64)
+def _area_weights(src, dst):
+    """
+    (dst, src) matrix that averages source pixels into dst bins, weighting
+    pixels that straddle a bin edge by their overlap (like cv2.INTER_AREA)
+    """
+    scale = src / dst
+    edges = np.arange(dst + 1) * scale
+    pixels = np.arange(src)
+    low = np.maximum(pixels[np.newaxis, :], edges[:-1, np.newaxis])
+    high = np.minimum(pixels[np.newaxis, :] + 1, edges[1:, np.newaxis])
+    return (np.clip(high - low, 0, None) / scale).astype(np.float32)
+
+def _dhash_thumbnails(gray, hash_size):
+    """Area-downscale a (N, H, W) float batch to (N, hash_size, hash_size + 1)"""
+    rows = _area_weights(gray.shape[1], hash_size)
+    cols = _area_weights(gray.shape[2], hash_size + 1)
+    return np.matmul(np.matmul(rows, gray), cols.T)
+
+def dhash(image, hash_size=IMAGE_HASH_SIZE, bgr=False):
+    """
+    Difference hash: compares horizontally adjacent pixels of a tiny
+    grayscale thumbnail
+    
+    Args:
+        image: PIL Image or uint8 array
+        hash_size: Hash is hash_size x hash_size bits
+        bgr: Array channels are in OpenCV's BGR order
+        
+    Returns:
+        str: Hex digest (16 characters for the default size)
+    """
+    gray = _to_gray_array(image, bgr)
+    return dhash_batch_gray(gray[np.newaxis], hash_size)[0]
+
+def phash(image, hash_size=IMAGE_HASH_SIZE, bgr=False):
+    """
+    DCT perceptual hash: compares the lowest DCT frequencies of a small
+    grayscale thumbnail with their median
+    
+    Args:
+        image: PIL Image or uint8 array
+        hash_size: Hash is hash_size x hash_size bits
+        bgr: Array channels are in OpenCV's BGR order
+        
+    Returns:
+        str: Hex digest (16 characters for the default size)
+    """
+    gray = _to_gray_array(image, bgr)
+    size = hash_size * 4
+    small = cv2.resize(gray, (size, size), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:hash_size, :hash_size]
+    bits = low > np.median(low)
+    return _bits_to_hex(bits[np.newaxis])[0]
+
+def perceptual_hash(image, bgr=False):
+    """Hash an image with the deployment's IMAGE_HASH_ALGORITHM"""
+    if IMAGE_HASH_ALGORITHM == 'phash':
+        return phash(image, bgr=bgr)
+    return dhash(image, bgr=bgr)
+
+def dhash_batch(batch, hash_size=IMAGE_HASH_SIZE):
+    """
+    Difference hashes for a whole (N, H, W, 3) batch from preprocess_batch
+    
+    Grayscale conversion is one cvtColor call over the batch viewed as a
+    single tall image, and downscaling is one matrix product.
+    
+    Args:
+        batch: uint8 array of shape (N, H, W, 3)
+        hash_size: Hash is hash_size x hash_size bits
+        
+    Returns:
+        list: Hex digests, one per image, equal to dhash() of each image
+    """
+    count, height, width, _ = batch.shape
+    if count == 0:
+        return []
+    tall = np.ascontiguousarray(batch).reshape(count * height, width, 3)
+    gray = cv2.cvtColor(tall, cv2.COLOR_RGB2GRAY).reshape(count, height, width)
+    return dhash_batch_gray(gray, hash_size)
+
+def dhash_batch_gray(gray, hash_size=IMAGE_HASH_SIZE):
+    """Difference hashes for a (N, H, W) grayscale batch"""
+    if gray.shape[0] == 0:
+        return []
+    thumbs = _dhash_thumbnails(gray.astype(np.float32), hash_size)
+    bits = thumbs[:, :, 1:] > thumbs[:, :, :-1]
+    return _bits_to_hex(bits)
+
+def hamming_distance(hash_a, hash_b):
+    """Number of differing bits between two hex hashes"""
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count('1')
+
+def vegetation_mask(image, bgr=False):
+    """
+    Mask of plant tissue in an RGB image
+    
+    A pixel counts as plant when it is green by the excess-green index
+    (2g - r - b on chromaticity coordinates) or, to keep chlorotic and
+    yellowing tissue, when its HSV hue is yellow-green with enough
+    saturation. Everything is computed with whole-array operations.
+    
+    Args:
+        image: PIL Image or RGB uint8 array
+        bgr: Array channels are in OpenCV's BGR order
+        
+    Returns:
+        numpy.ndarray: Boolean mask with the image's height and width
+    """
+    rgb = _to_rgb_array(image)
+    if rgb.ndim == 2:
+        return np.zeros(rgb.shape, dtype=bool)
+    rgb = rgb[..., :3]
+    
+    pixels = rgb.astype(np.float32)
+    total = pixels.sum(axis=2)
+    total[total == 0] = 1
+    r, g, b = (pixels[..., i] / total for i in ((2, 1, 0) if bgr else (0, 1, 2)))
+    excess_green = 2 * g - r - b
+    
+    hsv = cv2.cvtColor(np.ascontiguousarray(rgb), cv2.COLOR_BGR2HSV if bgr else cv2.COLOR_RGB2HSV)
+    hue, saturation, value = hsv[..., 0], hsv[..., 1], hsv[..., 2]
+    yellow_green = (hue >= 20) & (hue <= 90) & (saturation >= 60) & (value >= 40)
+    
+    return (excess_green > 0.05) | yellow_green
+
+def find_leaf_region(image, target_size=MODEL_INPUT_SIZE, padding=ROI_PADDING, bgr=False):
+    """
+    Bounding box of the plant tissue, padded and widened to the model
+    input's aspect ratio
+    
+    The mask is computed on a small thumbnail, so this costs about the same
+    for any input size.
+    
+    Args:
+        image: PIL Image or RGB uint8 array
+        target_size: Model input size, whose aspect ratio the box takes
+        padding: Fraction of the box size added on each side
+        bgr: Array channels are in OpenCV's BGR order
+        
+    Returns:
+        tuple: (left, top, right, bottom) in pixels of image, or None when
+            too little plant tissue was found to crop safely
+    """
+    rgb = _to_rgb_array(image)
+    height, width = rgb.shape[:2]
+    scale = ROI_MASK_SIZE / max(width, height)
+    if scale < 1:
+        thumb_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+        thumb = cv2.resize(rgb, thumb_size, interpolation=cv2.INTER_AREA)
+    else:
+        scale, thumb = 1.0, rgb
+    
+    mask = vegetation_mask(thumb, bgr).astype(np.uint8)
+    
+    # Drop isolated specks (grass, moss) so they don't stretch the box
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    if mask.mean() < ROI_MIN_COVERAGE:
+        return None
+    
+    rows = np.flatnonzero(mask.any(axis=1))
+    cols = np.flatnonzero(mask.any(axis=0))
+    left, right = cols[0] / scale, (cols[-1] + 1) / scale
+    top, bottom = rows[0] / scale, (rows[-1] + 1) / scale
+    
+    # Pad, then grow the shorter side to the target aspect ratio
+    box_width = (right - left) * (1 + 2 * padding)
+    box_height = (bottom - top) * (1 + 2 * padding)
+    aspect = target_size[0] / target_size[1]
+    box_width = min(width, max(box_width, box_height * aspect))
+    box_height = min(height, max(box_height, box_width / aspect))
+    
+    center_x, center_y = (left + right) / 2, (top + bottom) / 2
+    left = int(round(min(max(0, center_x - box_width / 2), width - box_width)))
+    top = int(round(min(max(0, center_y - box_height / 2), height - box_height)))
+    right = min(width, left + int(round(box_width)))
+    bottom = min(height, top + int(round(box_height)))
+    
+    return left, top, right, bottom
+
+def roi_decode_size(target_size=MODEL_INPUT_SIZE):
+    """
+    Size to decode an upload at when it will be cropped to its leaf region
+    
+    The crop is taken from the decoded image, so decoding at just the model
+    input size would leave a small leaf with fewer pixels than the model
+    input and the crop would be upscaled. Reduced-scale JPEG decoding still
+    applies, at a smaller reduction.
+    
+    Args:
+        target_size: Model input size tuple (width, height)
+        
+    Returns:
+        tuple: (width, height) to pass as decode_image_bytes' target_size
+    """
+    scale = max(1.0, ROI_DECODE_SCALE)
+    return int(round(target_size[0] * scale)), int(round(target_size[1] * scale))
+
+def crop_to_leaf(image, target_size=MODEL_INPUT_SIZE, padding=ROI_PADDING):
+    """
+    Crop a PIL Image to its leaf region
+    
+    Args:
+        image: Decoded PIL Image
+        target_size: Model input size, whose aspect ratio the crop takes
+        padding: Fraction of the box size added on each side
+        
+    Returns:
+        tuple: (cropped PIL Image, box as (left, top, right, bottom)
+            fractions of the frame), or (image, None) when no confident
+            leaf region was found
+    """
+    try:
+        box = find_leaf_region(image, target_size, padding)
+    except Exception as e:
+        print(f"Leaf region detection failed, using full frame: {str(e)}")
+        box = None
+    
+    if box is None:
+        return image, None
+    
+    width, height = image.size
+    left, top, right, bottom = box
+    fractions = (round(left / width, 4), round(top / height, 4),
+                 round(right / width, 4), round(bottom / height, 4))
+    return image.crop(box), fractions
+
+class ImageQualityError(ValueError):
+    """Raised when the quality gate rejects an image"""
+    
+    def __init__(self, report):
+        super().__init__("Image quality too low: " + "; ".join(report['issues']))
+        self.report = report
+
+def get_quality_gate(requested=None):
+    """
+    Resolve the quality gate mode
+    
+    Args:
+        requested: Per-request mode override, or None for the deployment
+            default (QUALITY_GATE environment variable)
+        
+    Returns:
+        str: One of QUALITY_GATE_MODES
+    """
+    mode = (requested or DEFAULT_QUALITY_GATE).lower()
+    if mode not in QUALITY_GATE_MODES:
+        raise ValueError(f"Unknown quality gate mode: {mode} (expected one of {', '.join(QUALITY_GATE_MODES)})")
+    return mode
+
+def assess_image_quality(image, bgr=False, alpha=None):
+    """
+    Measure sharpness, exposure and contrast of a photo
+    
+    All metrics come from one small grayscale thumbnail, so this takes
+    about a millisecond regardless of the upload size.
+    
+    Args:
+        image: PIL Image or RGB uint8 array
+        bgr: Array channels are in OpenCV's BGR order
+        alpha: Alpha channel (PIL Image or array) of a transparent upload
+            composited on white; only its visible pixels are measured
+        
+    Returns:
+        dict: usable (bool), sharpness, brightness, contrast,
+            clipped_dark, clipped_bright, issues (list of short problem
+            names) and feedback (list of tips for the farmer)
+    """
+    gray = _to_gray_array(image, bgr)
+    height, width = gray.shape
+    scale = QUALITY_SAMPLE_SIZE / max(width, height)
+    if scale < 1:
+        gray = cv2.resize(gray, (max(1, round(width * scale)), max(1, round(height * scale))),
+                          interpolation=cv2.INTER_AREA)
+    
+    laplacian = cv2.Laplacian(gray, cv2.CV_32F)
+    visible = _visible_pixels(alpha, gray.shape)
+    if visible is not None:
+        # The white background isn't part of the photo: leave it out, and
+        # leave out the cut-out's edge from the sharpness
+        edge_free = cv2.erode(visible.astype(np.uint8), np.ones((3, 3), np.uint8)).astype(bool)
+        laplacian = laplacian[edge_free] if edge_free.any() else laplacian[visible]
+        gray = gray[visible]
+    
+    mean, std = cv2.meanStdDev(gray)
+    brightness, contrast = float(mean[0][0]), float(std[0][0])
+    sharpness = float(laplacian.var())
+    histogram = np.bincount(gray.ravel(), minlength=256) / gray.size
+    clipped_dark = float(histogram[:6].sum())
+    clipped_bright = float(histogram[250:].sum())
+    
+    issues = []
+    feedback = []
+    if sharpness < MIN_SHARPNESS:
+        issues.append('blurry')
+        feedback.append("The photo is blurry. Hold the phone steady and tap the leaf on screen to focus.")
+    if brightness < MIN_BRIGHTNESS or clipped_dark > MAX_CLIPPED_FRACTION:
+        issues.append('too dark')
+        feedback.append("The photo is too dark. Take it in daylight or move out of the shade.")
+    if brightness > MAX_BRIGHTNESS or clipped_bright > MAX_CLIPPED_FRACTION:
+        issues.append('overexposed')
+        feedback.append("The photo is overexposed. Avoid direct sun on the leaf and turn off the flash.")
+    if contrast < MIN_CONTRAST:
+        issues.append('low contrast')
+        feedback.append("The leaf can't be made out. Fill the frame with the leaf against a plain background.")
+    
+    return {
+        'usable': not issues,
+        'sharpness': round(sharpness, 1),
+        'brightness': round(brightness, 1),
+        'contrast': round(contrast, 1),
+        'clipped_dark': round(clipped_dark, 3),
+        'clipped_bright': round(clipped_bright, 3),
+        'issues': issues,
+        'feedback': feedback
+    }
+
+def _visible_pixels(alpha, shape):
+    """Boolean mask of the visible pixels at shape, or None to measure every pixel"""
+    if alpha is None:
+        return None
+    alpha = np.asarray(alpha)
+    if alpha.shape != shape:
+        alpha = cv2.resize(alpha, (shape[1], shape[0]), interpolation=cv2.INTER_NEAREST)
+    visible = alpha > 0
+    # An (almost) fully transparent image has nothing else to measure
+    return visible if visible.mean() >= ROI_MIN_COVERAGE else None
+
+def check_image_quality(image, mode=None, bgr=False, alpha=None):
+    """
+    Run the quality gate on a decoded image
+    
+    Args:
+        image: Decoded PIL Image (or array)
+        mode: Gate mode override, or None for the deployment default
+        bgr: Array channels are in OpenCV's BGR order
+        alpha: Alpha channel of a transparent upload, so the white it was
+            composited on isn't judged as overexposure
+        
+    Returns:
+        dict: The assess_image_quality report, or None when the gate is off
+        
+    Raises:
+        ImageQualityError: In reject mode, when the image is unusable
+    """
+    mode = get_quality_gate(mode)
+    if mode == 'off':
+        return None
+    
+    report = assess_image_quality(image, bgr, alpha)
+    if mode == 'reject' and not report['usable']:
+        raise ImageQualityError(report)
+    return report
+
 def validate_image(image):
     """
     Validate if image is suitable for processing
     
     Args:
-        image: PIL Image object
+        image: Probe dict from probe_image (checked before decoding), or a
+            decoded PIL Image object
         
     Returns:
         tuple: (is_valid, error_message)
@@ -128,39 +920,453 @@ def validate_image(image):
         if image is None:
             return False, "Image is None"
         
+        if isinstance(image, dict):
+            width, height = image['width'], image['height']
+            mode, image_format = image['mode'], image['format']
+            size_bytes = image['bytes']
+        else:
+            # Size as stored in the file, not as decoded
+            width, height = image.info.get('original_size', image.size)
+            mode, image_format = image.mode, None
+            size_bytes = None
+        
+        # Check encoded size
+        if size_bytes is not None and size_bytes > MAX_IMAGE_BYTES:
+            return False, f"Image file too large (maximum {MAX_IMAGE_BYTES // (1024 * 1024)} MB)"
+        
+        # Check format
+        if image_format is not None and image_format not in ALLOWED_FORMATS:
+            return False, f"Unsupported image format: {image_format}"
+        
         # Check image size
-        width, height = image.size
-        if width < 100 or height < 100:
-            return False, "Image too small (minimum 100x100 pixels)"
+        if width < MIN_IMAGE_DIMENSION or height < MIN_IMAGE_DIMENSION:
+            return False, f"Image too small (minimum {MIN_IMAGE_DIMENSION}x{MIN_IMAGE_DIMENSION} pixels)"
+        
+        if width > MAX_IMAGE_DIMENSION or height > MAX_IMAGE_DIMENSION:
+            return False, f"Image too large (maximum {MAX_IMAGE_DIMENSION}x{MAX_IMAGE_DIMENSION} pixels)"
         
-        if width > 5000 or height > 5000:
-            return False, "Image too large (maximum 5000x5000 pixels)"
+        if width * height > MAX_IMAGE_PIXELS:
+            return False, f"Image has too many pixels (maximum {MAX_IMAGE_PIXELS // 1_000_000} megapixels)"
         
         # Check image mode
-        if image.mode not in ['RGB', 'RGBA', 'L']:
-            return False, f"Unsupported image mode: {image.mode}"
+        if mode not in SUPPORTED_MODES:
+            return False, f"Unsupported image mode: {mode}"
         
         return True, "Image is valid"
     
     except Exception as e:
         return False, f"Validation error: {str(e)}"
 
-def image_to_base64(image, format='JPEG'):
+class EncodedImage:
+    """
+    An image encoded once and shared by every consumer
+    
+    The AI call uses data_uri and the storage upload uses data, so a scan
+    is only ever JPEG-encoded (and base64-encoded) once.
+    """
+    
+    def __init__(self, data, format='JPEG'):
+        """
+        Args:
+            data: Encoded image bytes
+            format: Image format of data (JPEG, PNG, ...)
+        """
+        self.data = data
+        self.format = format.upper()
+        self._data_uri = None
+    
+    def __len__(self):
+        return len(self.data)
+    
+    @property
+    def content_type(self):
+        """MIME type for HTTP and storage uploads"""
+        return f"image/{self.format.lower()}"
+    
+    @property
+    def extension(self):
+        """File extension for storage object names"""
+        return 'jpg' if self.format == 'JPEG' else self.format.lower()
+    
+    @property
+    def data_uri(self):
+        """Base64 data URI, built on first use and cached"""
+        if self._data_uri is None:
+            img_str = base64.b64encode(self.data).decode()
+            self._data_uri = f"data:{self.content_type};base64,{img_str}"
+        return self._data_uri
+
+def get_encoding_profile(name=None):
+    """
+    Resolve an output encoding profile
+    
+    Args:
+        name: Profile name, or None for the deployment default
+            (IMAGE_ENCODING_PROFILE environment variable)
+        
+    Returns:
+        dict: Encoding options (format, quality, target_kb, optimize)
+    """
+    name = (name or DEFAULT_ENCODING_PROFILE).lower()
+    if name not in ENCODING_PROFILES:
+        raise ValueError(f"Unknown encoding profile: {name} (expected one of {', '.join(ENCODING_PROFILES)})")
+    return dict(ENCODING_PROFILES[name], name=name)
+
+def _save_image(image, format, quality=None, optimize=False):
+    """Encode image to bytes with the given settings"""
+    buffered = io.BytesIO()
+    options = {'format': format}
+    if quality is not None:
+        options['quality'] = quality
+    if optimize:
+        options['optimize'] = True
+    image.save(buffered, **options)
+    return buffered.getvalue()
+
+def _save_to_target_size(save, target_kb):
+    """
+    Binary search the highest quality whose output fits in target_kb
+    
+    Args:
+        save: Callable encoding the image at a given quality, returning bytes
+        target_kb: Output budget in kilobytes
+    """
+    target_bytes = target_kb * 1024
+    low, high = MIN_ENCODING_QUALITY, MAX_ENCODING_QUALITY
+    best = None
+    
+    while low <= high:
+        quality = (low + high) // 2
+        data = save(quality)
+        if len(data) <= target_bytes:
+            best = data
+            low = quality + 1
+        else:
+            high = quality - 1
+    
+    # Even the lowest quality is over budget: send the smallest we have
+    if best is None:
+        best = save(MIN_ENCODING_QUALITY)
+    return best
+
+def encode_image(image, format=None, quality=None, target_kb=None, profile=None):
+    """
+    Encode a PIL Image once for both the AI call and storage
+    
+    Explicit arguments override the settings of the encoding profile.
+    
+    Args:
+        image: PIL Image object
+        format: Image format (JPEG, WEBP, PNG, etc.)
+        quality: Encoder quality (JPEG/WebP)
+        target_kb: Largest acceptable output size in kilobytes; the quality
+            is searched to fit it
+        profile: Name in ENCODING_PROFILES, or None for the deployment default
+        
+    Returns:
+        EncodedImage
+    """
+    settings = get_encoding_profile(profile)
+    format = (format or settings['format']).upper()
+    quality = quality if quality is not None else settings.get('quality')
+    target_kb = target_kb if target_kb is not None else settings.get('target_kb')
+    optimize = settings.get('optimize', False)
+    
+    try:
+        if target_kb and format in ('JPEG', 'WEBP'):
+            data = _save_to_target_size(lambda q: _save_image(image, format, q, optimize), target_kb)
+        else:
+            data = _save_image(image, format, quality, optimize)
+        return EncodedImage(data, format)
+    
+    except Exception as e:
+        raise ValueError(f"Failed to encode image: {str(e)}")
+
+def image_to_base64(image, format=None, profile=None):
     """
     Convert PIL Image to base64 string
     
     Args:
         image: PIL Image object
-        format: Image format (JPEG, PNG, etc.)
+        format: Image format (JPEG, PNG, etc.), overrides the profile
+        profile: Encoding profile name, or None for the deployment default
         
     Returns:
         Base64 encoded string
     """
+    return encode_image(image, format, profile=profile).data_uri
+
+def get_image_pipeline(requested=None):
+    """
+    Resolve which image pipeline implementation to run
+    
+    Args:
+        requested: Pipeline name, or None for the deployment default
+            (IMAGE_PIPELINE environment variable)
+        
+    Returns:
+        str: One of IMAGE_PIPELINES
+    """
+    pipeline = (requested or DEFAULT_IMAGE_PIPELINE).lower()
+    if pipeline not in IMAGE_PIPELINES:
+        raise ValueError(f"Unknown image pipeline: {pipeline} (expected one of {', '.join(IMAGE_PIPELINES)})")
+    return pipeline
+
+def decode_image_array(image_bytes, target_size=None):
+    """
+    Decode encoded image bytes straight into a BGR uint8 ndarray
+    
+    The header is probed and validated first, as in decode_image_bytes.
+    JPEGs are decoded at a reduced scale (cv2.IMREAD_REDUCED_COLOR_*) when
+    target_size allows, transparent images are composited on white, and
+    EXIF orientation is ignored, so the pixels match the PIL pipeline.
+    
+    Args:
+        image_bytes: Encoded image bytes
+        target_size: Optional size tuple (width, height) the image will be
+            resized to afterwards
+        
+    Returns:
+        tuple: (BGR ndarray of shape (H, W, 3), probe dict). For a
+            transparent upload the probe dict also has 'alpha', its alpha
+            channel as an (H, W) array.
+    """
+    image = _open_image(image_bytes)
+    probe = _probe_from_open_image(image, image_bytes)
+    
+    is_valid, error_msg = validate_image(probe)
+    if not is_valid:
+        raise ValueError(f"Invalid image: {error_msg}")
+    
+    if probe['mode'] in ('RGBA', 'LA', 'P'):
+        flags = cv2.IMREAD_UNCHANGED
+    else:
+        flags = cv2.IMREAD_COLOR
+        if target_size is not None and probe['format'] in ('JPEG', 'MPO'):
+            reduced = {2: cv2.IMREAD_REDUCED_COLOR_2, 4: cv2.IMREAD_REDUCED_COLOR_4, 8: cv2.IMREAD_REDUCED_COLOR_8}
+            for factor in (8, 4, 2):
+                if probe['width'] // factor >= target_size[0] and probe['height'] // factor >= target_size[1]:
+                    flags = reduced[factor]
+                    break
+    
     try:
-        buffered = io.BytesIO()
-        image.save(buffered, format=format)
-        img_str = base64.b64encode(buffered.getvalue()).decode()
-        return f"data:image/{format.lower()};base64,{img_str}"
+        buffer = np.frombuffer(image_bytes, dtype=np.uint8)  # No copy
+        array = cv2.imdecode(buffer, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+        if array is None:
+            raise ValueError("OpenCV could not decode the image")
+        if array.dtype == np.uint16:
+            # 16-bit PNGs keep their depth with IMREAD_UNCHANGED
+            array = (array >> 8).astype(np.uint8)
+        
+        if array.ndim == 2:
+            array = cv2.cvtColor(array, cv2.COLOR_GRAY2BGR)
+        elif array.shape[2] == 4:
+            if array[..., 3].min() < 255:
+                probe['alpha'] = array[..., 3].copy()
+            array = _composite_on_white(array)
+        
+        return array, probe
     
     except Exception as e:
-        raise ValueError(f"Failed to encode image: {str(e)}")
\ No newline at end of file
+        raise ValueError(f"Failed to decode image: {str(e)}")
+
+def enhance_array(bgr, tier='quality'):
+    """
+    Enhance a BGR ndarray in place, the NumPy pipeline's enhance_image
+    
+    Only one extra full-size buffer is allocated: the LAB image, which is
+    reused as the denoising output.
+    
+    Args:
+        bgr: Contiguous BGR uint8 ndarray; overwritten
+        tier: Enhancement tier ('off', 'fast' or 'quality')
+        
+    Returns:
+        Enhanced BGR ndarray (bgr itself, or the reused work buffer)
+    """
+    if tier == 'off':
+        return bgr
+    
+    try:
+        lab = cv2.cvtColor(bgr, cv2.COLOR_BGR2LAB)
+        lightness = cv2.extractChannel(lab, 0)
+        
+        clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
+        clahe.apply(lightness, dst=lightness)
+        cv2.insertChannel(lightness, lab, 0)
+        cv2.cvtColor(lab, cv2.COLOR_LAB2BGR, dst=bgr)
+        
+        # Denoise (the expensive step, quality tier only) into the LAB buffer
+        if tier == 'quality':
+            return cv2.fastNlMeansDenoisingColored(bgr, lab, 10, 10, 7, 21)
+        return bgr
+    
+    except Exception as e:
+        print(f"Enhancement failed, returning original: {str(e)}")
+        return bgr
+
+def prepare_array(bgr, target_size=MODEL_INPUT_SIZE, tier=None, enhance_after_resize=None, crop_roi=None,
+                  resize_backend=None):
+    """
+    Crop, enhance and resize a decoded BGR ndarray, the NumPy pipeline's
+    prepare_image
+    
+    The leaf crop is a view (no copy) and the resize writes into one
+    preallocated model-input buffer that enhancement then works in.
+    
+    Args:
+        bgr: Decoded BGR ndarray from decode_image_array
+        target_size: Model input size tuple (width, height)
+        tier: Enhancement tier override, or None for the deployment default
+        enhance_after_resize: Enhance the resized image rather than the
+            original; None uses ENHANCE_AFTER_RESIZE
+        crop_roi: Crop to the leaf region first; None uses LEAF_ROI_CROP
+        resize_backend: Name in RESIZE_BACKENDS, or None for the default
+        
+    Returns:
+        dict: Same keys as prepare_image, with 'image' a BGR ndarray
+    """
+    tier = get_enhancement_tier(tier)
+    image_hash = perceptual_hash(bgr, bgr=True)
+    if enhance_after_resize is None:
+        enhance_after_resize = ENHANCE_AFTER_RESIZE
+    if crop_roi is None:
+        crop_roi = LEAF_ROI_CROP
+    
+    roi = None
+    if crop_roi:
+        try:
+            box = find_leaf_region(bgr, target_size, bgr=True)
+        except Exception as e:
+            print(f"Leaf region detection failed, using full frame: {str(e)}")
+            box = None
+        if box is not None:
+            height, width = bgr.shape[:2]
+            left, top, right, bottom = box
+            roi = (round(left / width, 4), round(top / height, 4),
+                   round(right / width, 4), round(bottom / height, 4))
+            bgr = bgr[top:bottom, left:right]
+    
+    width, height = target_size
+    resized = np.empty((height, width, 3), dtype=np.uint8)
+    
+    if enhance_after_resize:
+        resize_array(bgr, target_size, resize_backend, dst=resized)
+        processed = enhance_array(resized, tier)
+    else:
+        enhanced = enhance_array(np.ascontiguousarray(bgr), tier)
+        processed = resize_array(enhanced, target_size, resize_backend, dst=resized)
+    
+    return {
+        'image': processed,
+        'enhancement_tier': tier,
+        'image_hash': image_hash,
+        'roi': roi
+    }
+
+def _imencode(bgr, format, quality=None, optimize=False):
+    """Encode a BGR ndarray to bytes with cv2.imencode"""
+    if format == 'JPEG':
+        params = [cv2.IMWRITE_JPEG_QUALITY, quality if quality is not None else DEFAULT_JPEG_QUALITY]
+        if optimize:
+            params += [cv2.IMWRITE_JPEG_OPTIMIZE, 1]
+        extension = '.jpg'
+    elif format == 'WEBP':
+        params = [cv2.IMWRITE_WEBP_QUALITY, quality if quality is not None else 80]
+        extension = '.webp'
+    else:
+        params = []
+        extension = '.' + format.lower()
+    
+    ok, buffer = cv2.imencode(extension, bgr, params)
+    if not ok:
+        raise ValueError(f"OpenCV could not encode {format}")
+    return buffer.tobytes()
+
+def encode_array(bgr, format=None, quality=None, target_kb=None, profile=None):
+    """
+    Encode a BGR ndarray with cv2.imencode, the NumPy pipeline's encode_image
+    
+    Args:
+        bgr: BGR uint8 ndarray
+        format: Image format (JPEG, WEBP, PNG), overrides the profile
+        quality: Encoder quality (JPEG/WebP)
+        target_kb: Largest acceptable output size in kilobytes
+        profile: Name in ENCODING_PROFILES, or None for the deployment default
+        
+    Returns:
+        EncodedImage
+    """
+    settings = get_encoding_profile(profile)
+    format = (format or settings['format']).upper()
+    quality = quality if quality is not None else settings.get('quality')
+    target_kb = target_kb if target_kb is not None else settings.get('target_kb')
+    optimize = settings.get('optimize', False)
+    
+    try:
+        if target_kb and format in ('JPEG', 'WEBP'):
+            data = _save_to_target_size(lambda q: _imencode(bgr, format, q, optimize), target_kb)
+        else:
+            data = _imencode(bgr, format, quality, optimize)
+        return EncodedImage(data, format)
+    
+    except Exception as e:
+        raise ValueError(f"Failed to encode image: {str(e)}")
+
+def process_upload(image_data, target_size=MODEL_INPUT_SIZE, tier=None, encoding_profile=None,
+                   quality_gate=None, pipeline=None, resize_backend=None):
+    """
+    Run a whole upload through decode, quality gate, crop, enhance, resize
+    and encode
+    
+    Args:
+        image_data: Raw image bytes, or a base64 encoded image string
+        target_size: Model input size tuple (width, height)
+        tier: Enhancement tier, or None for the deployment default
+        encoding_profile: Output encoding profile, or None for the default
+        quality_gate: Quality gate mode, or None for the default
+        pipeline: 'pil' or 'numpy', or None for IMAGE_PIPELINE
+        resize_backend: Name in RESIZE_BACKENDS, or None for the default
+        
+    Returns:
+        dict: prepare_image result plus 'original_size', 'quality' (the
+            quality report), 'encoded' (EncodedImage), 'pipeline' and
+            'processing' (the effective pipeline, enhancement tier and
+            encoding profile, for the result cache key)
+        
+    Raises:
+        ImageQualityError: When the quality gate rejects the upload
+        ValueError: When the upload can't be decoded or fails validation
+    """
+    pipeline = get_image_pipeline(pipeline)
+    decode_size = roi_decode_size(target_size) if LEAF_ROI_CROP else target_size
+    
+    if pipeline == 'numpy':
+        image_bytes = base64_to_bytes(image_data) if isinstance(image_data, str) else image_data
+        array, probe = decode_image_array(image_bytes, decode_size)
+        
+        # Refuse unusable photos before any enhancement or AI spend
+        quality = check_image_quality(array, quality_gate, bgr=True, alpha=probe.get('alpha'))
+        
+        prepared = prepare_array(array, target_size, tier=tier, resize_backend=resize_backend)
+        prepared['encoded'] = encode_array(prepared['image'], profile=encoding_profile)
+        prepared['original_size'] = (probe['width'], probe['height'])
+    
+    else:
+        if isinstance(image_data, str):
+            image = decode_base64_image(image_data, decode_size)
+        else:
+            image = decode_image_bytes(image_data, decode_size)
+        
+        # Refuse unusable photos before any enhancement or AI spend
+        quality = check_image_quality(image, quality_gate, alpha=image.info.get('alpha'))
+        
+        prepared = prepare_image(image, target_size, tier=tier, resize_backend=resize_backend)
+        prepared['encoded'] = encode_image(prepared['image'], profile=encoding_profile)
+        prepared['original_size'] = image.info['original_size']
+    
+    prepared['quality'] = quality
+    prepared['pipeline'] = pipeline
+    prepared['processing'] = (f"{pipeline}/{prepared['enhancement_tier']}/"
+                              f"{get_encoding_profile(encoding_profile)['name']}")
+    return prepared
@@ -0,0 +1,276 @@
+"""
+Analysis Prompt Registry
+Versioned prompt templates, rendered once per crop and measured in tokens,
+with an optional A/B split between two versions
+"""
+
+import os
+import hashlib
+import threading
+
+# Templates are never edited once released: add a new version instead, so
+# results cached under the old version are not served for the new prompt.
+# {crop} is replaced with the crop name ("Tomato", or "plant" if unknown).
+PROMPT_TEMPLATES = {
+    'full-2': """You are an expert plant pathologist. Analyze this {crop} image and identify any diseases.
+
+Provide your analysis in the following JSON format:
+{{
+    "disease_detected": "name of disease or 'Healthy Plant'",
+    "confidence": confidence score between 0 and 1,
+    "severity": "None/Mild/Moderate/Severe",
+    "symptoms_observed": ["list", "of", "symptoms"],
+    "recommendation": "brief treatment recommendation"
+}}
+
+For {crop}, look for common diseases including:
+- Fungal diseases (spots, blights, molds, rusts)
+- Bacterial diseases (lesions, wilts, spots)
+- Viral diseases (mosaic patterns, yellowing, deformities)
+- Nutrient deficiencies (chlorosis, necrosis)
+- Pest damage (holes, discoloration)
+- Environmental stress (burning, wilting)
+
+Focus on visible symptoms like:
+- Leaf discoloration, spots, or patterns
+- Leaf curling, wilting, or deformity
+- Mold, fungal growth, or unusual textures
+- Stem or branch lesions
+- Overall plant health and vigor
+- Any unusual growths or discolorations
+
+Be specific about the disease name and provide practical treatment recommendations.
+If the plant looks healthy, respond with "Healthy Plant".
+If you cannot identify a specific disease, describe the symptoms and suggest "Unknown Disease - Consult Expert".""",
+    
+    'compact-1': """You are an expert plant pathologist. Diagnose this {crop} image.
+Consider fungal, bacterial and viral diseases, nutrient deficiencies, pests and environmental stress, judging by leaf color, spots, lesions, mold, curling and wilting.
+
+Answer in this JSON format:
+{{"disease_detected": "specific disease name, 'Healthy Plant' or 'Unknown Disease - Consult Expert'", "confidence": 0 to 1, "severity": "None/Mild/Moderate/Severe", "symptoms_observed": ["visible symptoms"], "recommendation": "practical treatment"}}""",
+}
+
+# Appended in JSON mode to keep answers short
+JSON_MODE_SUFFIX = """
+
+Respond with only the JSON object, no other text. Use exactly these five keys.
+"confidence" is a number, not a string. List at most 5 short symptoms.
+Keep the recommendation under 40 words."""
+
+# Appended when several photos of one plant are sent in one request
+MULTI_IMAGE_SUFFIX = """
+
+These {count} photos show the same plant, numbered 1 to {count} in the order given. Base one diagnosis on all of them.
+Also add an "image_notes" key: a list of {count} short notes, one per photo in order, saying what each photo shows."""
+
+# Template the detector asks with
+PROMPT_VERSION = os.getenv('PROMPT_VERSION', 'full-2')
+
+# A/B test: send PROMPT_VARIANT_SHARE (0-1) of images to PROMPT_VARIANT
+PROMPT_VARIANT = os.getenv('PROMPT_VARIANT') or None
+PROMPT_VARIANT_SHARE = float(os.getenv('PROMPT_VARIANT_SHARE', '0.5'))
+
+# Rendered at startup (the app's crop picker); other crops render on first use
+PRECOMPUTED_CROPS = ('apple', 'beans', 'corn', 'cucumber', 'grape', 'lettuce', 'pepper',
+                     'potato', 'rice', 'tomato', 'wheat', 'unknown')
+
+# Rendered prompts kept; crop_type comes from the client, so unlisted crops
+# beyond this are rendered per request instead of growing the registry
+MAX_RENDERED_PROMPTS = 256
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+def _get_tokenizer():
+    """tiktoken encoding if tiktoken is installed (and its data available), else None"""
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        try:
+            import tiktoken
+            _tokenizer = tiktoken.get_encoding('cl100k_base')
+        except Exception:
+            # Optional dependency: fall back to the character estimate
+            _tokenizer = None
+        _tokenizer_loaded = True
+    return _tokenizer
+
+def count_tokens(text):
+    """
+    Count the tokens of a prompt
+    
+    Uses tiktoken's cl100k_base encoding when available, else about four
+    characters per token. Both approximate the Llama tokenizer closely
+    enough to compare prompt versions.
+    
+    Args:
+        text: Prompt text
+    
+    Returns:
+        int: Token count
+    """
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text))
+    return max(1, round(len(text) / 4))
+
+def _crop_display(crop_type):
+    """Crop name as written in the prompt"""
+    if crop_type and crop_type.lower() != 'unknown':
+        return crop_type.title()
+    return 'plant'
+
+class Prompt:
+    """A template rendered for one crop and number of photos"""
+    
+    def __init__(self, template, crop_type, json_mode, text, images=1):
+        self.template = template
+        self.crop_type = crop_type
+        self.json_mode = json_mode
+        self.images = images
+        self.text = text
+        self.tokens = count_tokens(text)
+    
+    @property
+    def version(self):
+        """Prompt version for cache keys: the template, JSON mode and photo count"""
+        version = f"{self.template}-json" if self.json_mode else self.template
+        return f"{version}-x{self.images}" if self.images > 1 else version
+
+class PromptRegistry:
+    """Rendered prompts by template, crop and output mode"""
+    
+    def __init__(self, version=PROMPT_VERSION, variant=PROMPT_VARIANT, variant_share=PROMPT_VARIANT_SHARE,
+                 crops=PRECOMPUTED_CROPS):
+        """
+        Render the prompts of the active templates for every listed crop
+        
+        Args:
+            version: Template used by default
+            variant: Template to A/B test against it, or None
+            variant_share: Share of images (0-1) given the variant
+            crops: Crops to render up front
+        
+        Raises:
+            ValueError: If a template name is not in PROMPT_TEMPLATES
+        """
+        for name in (version, variant):
+            if name is not None and name not in PROMPT_TEMPLATES:
+                raise ValueError(f"Unknown prompt template: {name} (expected one of {', '.join(PROMPT_TEMPLATES)})")
+        
+        self.version = version
+        self.variant = variant
+        self.variant_share = min(1.0, max(0.0, variant_share))
+        
+        self._prompts = {}
+        self._lock = threading.Lock()
+        self._counters = {name: {'requests': 0, 'prompt_tokens': 0} for name in self.templates()}
+        
+        for name in self.templates():
+            for crop_type in crops:
+                for json_mode in (False, True):
+                    self.get(crop_type, name, json_mode)
+    
+    def templates(self):
+        """Templates in use"""
+        return [self.version] + ([self.variant] if self.variant else [])
+    
+    def get(self, crop_type, template=None, json_mode=False, images=1):
+        """
+        Rendered prompt for a crop
+        
+        Args:
+            crop_type: Crop name
+            template: Template name, or None for the default version
+            json_mode: Add the JSON mode instructions
+            images: Photos of the plant sent with the prompt
+        
+        Returns:
+            Prompt
+        """
+        template = template or self.version
+        crop_type = (crop_type or 'unknown').lower()
+        key = (template, crop_type, json_mode, images)
+        
+        prompt = self._prompts.get(key)
+        if prompt is None:
+            text = PROMPT_TEMPLATES[template].format(crop=_crop_display(crop_type))
+            if json_mode:
+                text += JSON_MODE_SUFFIX
+            if images > 1:
+                text += MULTI_IMAGE_SUFFIX.format(count=images)
+            prompt = Prompt(template, crop_type, json_mode, text, images)
+            with self._lock:
+                if len(self._prompts) < MAX_RENDERED_PROMPTS:
+                    prompt = self._prompts.setdefault(key, prompt)
+        return prompt
+    
+    def select(self, crop_type, image_hash, json_mode=False, images=1):
+        """
+        Prompt for one analysis, choosing the A/B arm by image
+        
+        The same image always gets the same arm, so repeat scans hit the
+        result cache.
+        
+        Args:
+            crop_type: Crop name
+            image_hash: Content hash of the image (or of all the photos)
+            json_mode: Add the JSON mode instructions
+            images: Photos of the plant sent with the prompt
+        
+        Returns:
+            Prompt
+        """
+        template = self.version
+        if self.variant is not None:
+            bucket = int(hashlib.sha256(image_hash.encode()).hexdigest()[:8], 16) / 0x100000000
+            if bucket < self.variant_share:
+                template = self.variant
+        
+        prompt = self.get(crop_type, template, json_mode, images)
+        with self._lock:
+            counters = self._counters[template]
+            counters['requests'] += 1
+            counters['prompt_tokens'] += prompt.tokens
+        return prompt
+    
+    def token_counts(self, json_mode=False):
+        """
+        Token count of every rendered prompt
+        
+        Returns:
+            dict: {template: {crop: tokens}}
+        """
+        with self._lock:
+            prompts = list(self._prompts.values())
+        counts = {}
+        for prompt in prompts:
+            if prompt.json_mode == json_mode and prompt.images == 1:
+                counts.setdefault(prompt.template, {})[prompt.crop_type] = prompt.tokens
+        return counts
+    
+    def stats(self):
+        """Active templates, and requests and prompt tokens per template"""
+        with self._lock:
+            counters = {name: dict(values) for name, values in self._counters.items()}
+        return {
+            'version': self.version,
+            'variant': self.variant,
+            'variant_share': self.variant_share if self.variant else 0.0,
+            'tokenizer': 'tiktoken' if _get_tokenizer() is not None else 'estimate',
+            'templates': counters
+        }
+
+_prompt_registry = None
+_prompt_registry_lock = threading.Lock()
+
+def get_prompt_registry():
+    """Get the process-wide prompt registry, rendering it on first use"""
+    global _prompt_registry
+    if _prompt_registry is None:
+        with _prompt_registry_lock:
+            if _prompt_registry is None:
+                _prompt_registry = PromptRegistry()
+                for template, crops in _prompt_registry.token_counts().items():
+                    print(f"📝 Prompt {template}: {min(crops.values())}-{max(crops.values())} tokens "
+                          f"across {len(crops)} crops")
+    return _prompt_registry
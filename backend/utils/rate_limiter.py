@@ -0,0 +1,274 @@
+"""
+Upstream Rate Limiting
+Request and token buckets per model that keep calls under Groq's rate
+limits, sized from the x-ratelimit-* headers of its responses. Calls over
+budget wait a bounded time for it, then fail fast instead of collecting 429s.
+"""
+
+import os
+import re
+import math
+import time
+import asyncio
+import threading
+
+from .resilience import UpstreamUnavailableError
+
+# Set GROQ_RATE_LIMIT=false to send every call straight upstream
+GROQ_RATE_LIMIT = os.getenv('GROQ_RATE_LIMIT', 'true').lower() not in ('0', 'false', 'no', 'off')
+
+# Starting token budget per model; the bucket takes its size from
+# x-ratelimit-limit-tokens once a response arrives. Groq's headers give no
+# per-minute request limit to size a request bucket from, so it is only
+# kept when GROQ_RATE_LIMIT_RPM is set (to the plan's requests per minute).
+GROQ_RATE_LIMIT_RPM = float(os.getenv('GROQ_RATE_LIMIT_RPM') or 0) or None
+GROQ_RATE_LIMIT_TPM = float(os.getenv('GROQ_RATE_LIMIT_TPM', '15000'))
+
+# Longest a call may queue for budget; calls that would wait longer fail at once
+GROQ_RATE_LIMIT_MAX_WAIT = float(os.getenv('GROQ_RATE_LIMIT_MAX_WAIT', '2'))
+
+# Tokens an image counts for in a call's estimate (one 560x560 tile); the
+# estimate is corrected with the actual usage once the answer arrives
+GROQ_IMAGE_TOKENS = int(os.getenv('GROQ_IMAGE_TOKENS', '1600'))
+
+_DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+_DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+class RateLimitExceededError(UpstreamUnavailableError):
+    """Raised without calling the upstream when the rate budget is spent"""
+
+def parse_reset(value):
+    """
+    Seconds in an x-ratelimit-reset-* header ("2m59.56s", "7.66s", "350ms")
+    
+    Returns:
+        float or None
+    """
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+def _header_number(headers, name):
+    """Numeric header value, or None"""
+    try:
+        return float(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Budget refilled at a steady rate
+    
+    Reservations may take the level below zero: the debt is the queue, and
+    it says how long the newest reservation has to wait.
+    """
+    
+    def __init__(self, capacity, per_seconds=60):
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.level = capacity
+        self._updated = time.monotonic()
+    
+    def reserve(self, amount, now):
+        """Take amount; returns the seconds until the level is back at zero"""
+        self._refill(now)
+        self.level -= amount
+        return max(0.0, -self.level / self.rate) if self.rate else math.inf
+    
+    def refund(self, amount, now):
+        """Give back an unused reservation"""
+        self._refill(now)
+        self.level = min(self.capacity, self.level + amount)
+    
+    def resize(self, capacity, per_seconds, now):
+        """Change the size and refill rate, keeping the current level"""
+        self._refill(now)
+        self.capacity = capacity
+        self.rate = capacity / per_seconds
+        self.level = min(self.level, capacity)
+    
+    def cap(self, remaining, now):
+        """Lower the level to what the upstream says is left"""
+        self._refill(now)
+        self.level = min(self.level, remaining)
+    
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+class RateLimiter:
+    """Request and token budget for one model"""
+    
+    def __init__(self, model, requests_per_minute=GROQ_RATE_LIMIT_RPM, tokens_per_minute=GROQ_RATE_LIMIT_TPM,
+                 max_wait=GROQ_RATE_LIMIT_MAX_WAIT):
+        """
+        Initialize the limiter
+        
+        Args:
+            model: Model the budget is for (Groq limits each model separately)
+            requests_per_minute: Request budget, or None for no request
+                bucket (the daily quota in the headers still pauses calls)
+            tokens_per_minute: Starting token budget
+            max_wait: Seconds a call may wait for budget
+        """
+        self.model = model
+        self.max_wait = max_wait
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute)
+        
+        self._lock = threading.Lock()
+        self._paused_until = 0.0
+        self._counters = {'admitted': 0, 'delayed': 0, 'rejected': 0, 'upstream_429': 0}
+    
+    def acquire(self, tokens):
+        """
+        Reserve budget for one call, waiting up to max_wait for it
+        
+        Args:
+            tokens: Estimated tokens of the call (prompt, images and
+                max_tokens)
+        
+        Returns:
+            int: Tokens reserved, to pass to settle() or release()
+        
+        Raises:
+            RateLimitExceededError: If the budget won't be there within
+                max_wait (has retry_after)
+        """
+        wait, tokens = self._reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return tokens
+    
+    async def async_acquire(self, tokens):
+        """Async version of acquire; cancelling the wait gives the budget back"""
+        wait, tokens = self._reserve(tokens)
+        if wait > 0:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.release(tokens)
+                raise
+        return tokens
+    
+    def release(self, reserved):
+        """Give back the budget of a call that failed or was never sent"""
+        with self._lock:
+            now = time.monotonic()
+            if self.requests is not None:
+                self.requests.refund(1, now)
+            self.tokens.refund(reserved, now)
+    
+    def settle(self, reserved, used):
+        """Correct a reservation with the tokens the call actually used"""
+        if used is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if used < reserved:
+                self.tokens.refund(reserved - used, now)
+            else:
+                self.tokens.reserve(used - reserved, now)
+    
+    def update(self, headers):
+        """
+        Adjust the budget from the x-ratelimit-* headers of a response
+        
+        Groq reports tokens per minute and requests per day: the token
+        bucket takes its size from the former, and both buckets are lowered
+        to the remaining counts. An exhausted daily quota pauses calls until
+        its reset time.
+        """
+        limit_tokens = _header_number(headers, 'x-ratelimit-limit-tokens')
+        remaining_tokens = _header_number(headers, 'x-ratelimit-remaining-tokens')
+        remaining_requests = _header_number(headers, 'x-ratelimit-remaining-requests')
+        
+        with self._lock:
+            now = time.monotonic()
+            if limit_tokens and limit_tokens != self.tokens.capacity:
+                self.tokens.resize(limit_tokens, 60, now)
+            if remaining_tokens is not None:
+                self.tokens.cap(remaining_tokens, now)
+            if remaining_requests is not None:
+                if self.requests is not None:
+                    self.requests.cap(remaining_requests, now)
+                if remaining_requests < 1:
+                    reset = parse_reset(headers.get('x-ratelimit-reset-requests'))
+                    self._pause(now, reset or 1)
+    
+    def pause(self, seconds):
+        """Hold every call for seconds (the upstream answered 429)"""
+        with self._lock:
+            self._counters['upstream_429'] += 1
+            self._pause(time.monotonic(), seconds)
+    
+    def stats(self):
+        """Budget levels and counters, for logging and health checks"""
+        with self._lock:
+            now = time.monotonic()
+            if self.requests is not None:
+                self.requests._refill(now)
+            self.tokens._refill(now)
+            return dict(
+                self._counters,
+                model=self.model,
+                requests_available=round(self.requests.level, 2) if self.requests else None,
+                requests_per_minute=self.requests.capacity if self.requests else None,
+                tokens_available=round(self.tokens.level),
+                tokens_per_minute=self.tokens.capacity,
+                paused_for=round(max(0.0, self._paused_until - now), 2)
+            )
+    
+    def _reserve(self, tokens):
+        """Take the budget for a call and return (wait, tokens reserved), or raise if too long"""
+        with self._lock:
+            now = time.monotonic()
+            # A call larger than the whole bucket would never fit: it runs on a
+            # full bucket instead, and settle() charges the rest afterwards
+            tokens = min(tokens, self.tokens.capacity)
+            wait = max(self.requests.reserve(1, now) if self.requests else 0.0,
+                       self.tokens.reserve(tokens, now), self._paused_until - now)
+            if wait > self.max_wait:
+                if self.requests is not None:
+                    self.requests.refund(1, now)
+                self.tokens.refund(tokens, now)
+                self._counters['rejected'] += 1
+                retry_after = max(1, math.ceil(min(wait, 24 * 60 * 60)))
+                raise RateLimitExceededError("AI service rate limit reached, try again shortly",
+                                             retry_after=retry_after)
+            self._counters['admitted'] += 1
+            if wait > 0:
+                self._counters['delayed'] += 1
+            return wait, tokens
+    
+    def _pause(self, now, seconds):
+        """Hold calls until now + seconds (lock held)"""
+        self._paused_until = max(self._paused_until, now + seconds)
+
+_rate_limiters = {}
+_rate_limiters_lock = threading.Lock()
+
+def get_rate_limiter(model):
+    """Get the process-wide limiter for a model, or None when GROQ_RATE_LIMIT is off"""
+    if not GROQ_RATE_LIMIT:
+        return None
+    limiter = _rate_limiters.get(model)
+    if limiter is None:
+        with _rate_limiters_lock:
+            limiter = _rate_limiters.get(model)
+            if limiter is None:
+                limiter = _rate_limiters[model] = RateLimiter(model)
+    return limiter
+
+def rate_limiter_stats():
+    """Stats of every limiter created so far"""
+    with _rate_limiters_lock:
+        limiters = list(_rate_limiters.values())
+    return [limiter.stats() for limiter in limiters]
@@ -0,0 +1,143 @@
+"""
+Request Parsing Utilities
+Reads detection uploads sent as JSON (base64), raw image bodies or
+multipart/form-data
+"""
+
+import json
+from urllib.parse import urlparse, parse_qs
+
+# Content types accepted as a raw image body
+RAW_IMAGE_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'application/octet-stream')
+
+def parse_content_type(header):
+    """
+    Split a Content-Type header into its media type and parameters
+    
+    Returns:
+        tuple: (media_type, params dict)
+    """
+    parts = (header or '').split(';')
+    media_type = parts[0].strip().lower()
+    params = {}
+    for part in parts[1:]:
+        if '=' in part:
+            key, value = part.split('=', 1)
+            params[key.strip().lower()] = value.strip().strip('"')
+    return media_type, params
+
+def is_binary_upload(content_type):
+    """True if the body carries raw image bytes rather than base64 JSON"""
+    media_type, _ = parse_content_type(content_type)
+    return media_type in RAW_IMAGE_TYPES or media_type == 'multipart/form-data'
+
+def parse_multipart(body, boundary):
+    """
+    Split a multipart/form-data body into its parts
+    
+    Args:
+        body: Request body bytes
+        boundary: Boundary from the Content-Type header
+        
+    Returns:
+        list: dicts with name, filename, content_type and data (bytes)
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    parts = []
+    
+    position = body.find(delimiter)
+    if position < 0:
+        raise ValueError("Malformed multipart body: boundary not found")
+    
+    while True:
+        position += len(delimiter)
+        if body[position:position + 2] == b'--':
+            break  # Closing delimiter
+        
+        header_end = body.find(b'\r\n\r\n', position)
+        next_delimiter = body.find(b'\r\n' + delimiter, header_end)
+        if header_end < 0 or next_delimiter < 0:
+            raise ValueError("Malformed multipart body: unterminated part")
+        
+        headers = {}
+        for line in body[position:header_end].decode('utf-8', 'replace').split('\r\n'):
+            if ':' in line:
+                key, value = line.split(':', 1)
+                headers[key.strip().lower()] = value.strip()
+        
+        _, disposition = parse_content_type(headers.get('content-disposition'))
+        parts.append({
+            'name': disposition.get('name'),
+            'filename': disposition.get('filename'),
+            'content_type': headers.get('content-type', 'text/plain'),
+            'data': body[header_end + 4:next_delimiter]
+        })
+        
+        position = next_delimiter + 2
+    
+    return parts
+
+def parse_detect_request(content_type, body, path):
+    """
+    Parse a detection request in any of the supported upload formats
+    
+    - application/json: {"image": "<base64>", "crop_type": ..., ...}, or
+      "images": [...] for several photos of one plant
+    - image/jpeg, image/png, ...: raw image body, other fields as query
+      parameters (?crop_type=tomato&user_id=...)
+    - multipart/form-data: one or more "image" file parts plus text fields
+      (query parameters are also read)
+    
+    Args:
+        content_type: Content-Type request header
+        body: Request body bytes
+        path: Request path including the query string
+        
+    Returns:
+        dict: 'images' (every uploaded image, as raw bytes or a base64
+            string), 'image_bytes' (the first raw image, or None),
+            'image_base64' (the first base64 image from JSON, or None) and
+            'fields' (the other request parameters)
+    """
+    media_type, params = parse_content_type(content_type)
+    query = parse_qs(urlparse(path).query)
+    fields = {key: values[0] for key, values in query.items()}
+    images = []
+    
+    if media_type in RAW_IMAGE_TYPES:
+        images.append(body)
+    
+    elif media_type == 'multipart/form-data':
+        if 'boundary' not in params:
+            raise ValueError("Malformed multipart body: missing boundary")
+        
+        for part in parse_multipart(body, params['boundary']):
+            if part['name'] in ('image', 'images'):
+                images.append(part['data'])
+            elif part['name']:
+                fields[part['name']] = part['data'].decode('utf-8')
+    
+    else:
+        try:
+            data = json.loads(body.decode('utf-8'))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"Invalid JSON body: {str(e)}")
+        
+        if not isinstance(data, dict):
+            raise ValueError("Invalid JSON body: expected an object")
+        
+        image_base64 = data.pop('image', None)
+        extra_images = data.pop('images', None) or []
+        if not isinstance(extra_images, list) or not all(isinstance(image, str) for image in extra_images):
+            raise ValueError("Invalid JSON body: 'images' must be a list of base64 strings")
+        images.extend([image_base64] + extra_images)
+        fields.update(data)
+    
+    images = [image for image in images if image]
+    first = images[0] if images else None
+    return {
+        'images': images,
+        'image_bytes': first if isinstance(first, bytes) else None,
+        'image_base64': first if isinstance(first, str) else None,
+        'fields': fields
+    }
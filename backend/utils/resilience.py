@@ -0,0 +1,450 @@
+"""
+Resilience for Upstream Calls
+Bounded retries with jittered backoff, a circuit breaker that fails fast
+while the upstream is down, and hedged requests for slow answers
+"""
+
+import os
+import math
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait as wait_futures
+from email.utils import parsedate_to_datetime
+
+import groq
+
+# Retries after the first attempt, for rate limits, 5xx and network errors
+GROQ_MAX_RETRIES = int(os.getenv('GROQ_MAX_RETRIES', '2'))
+
+# Backoff: a random delay up to base * 2^attempt seconds, capped at max
+GROQ_RETRY_BASE_DELAY = float(os.getenv('GROQ_RETRY_BASE_DELAY', '0.5'))
+GROQ_RETRY_MAX_DELAY = float(os.getenv('GROQ_RETRY_MAX_DELAY', '8'))
+
+# Consecutive failures that open the circuit, and seconds before a trial call
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', '5'))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv('CIRCUIT_RESET_TIMEOUT', '30'))
+
+# Hedging: when the primary model hasn't answered within this latency
+# percentile, send the same request to the hedge model as well
+GROQ_HEDGE = os.getenv('GROQ_HEDGE', 'false').lower() in ('1', 'true', 'yes', 'on')
+GROQ_HEDGE_MODEL = os.getenv('GROQ_HEDGE_MODEL') or None  # None: the primary model itself
+GROQ_HEDGE_PERCENTILE = float(os.getenv('GROQ_HEDGE_PERCENTILE', '95'))
+GROQ_HEDGE_DELAY = float(os.getenv('GROQ_HEDGE_DELAY', '5'))  # Until enough latencies are known
+GROQ_HEDGE_BUDGET = float(os.getenv('GROQ_HEDGE_BUDGET', '0.1'))  # Most requests that may be hedged
+
+# HTTP statuses worth another attempt
+RETRYABLE_STATUSES = (408, 409, 429, 500, 502, 503, 504)
+
+class UpstreamUnavailableError(Exception):
+    """Raised when the upstream can't answer right now; retry after a while"""
+    
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class CircuitOpenError(UpstreamUnavailableError):
+    """Raised without calling the upstream while the circuit is open"""
+
+def is_retryable(error):
+    """Whether a failed call is worth another attempt"""
+    if isinstance(error, (groq.APIConnectionError, groq.APITimeoutError)):
+        return True
+    if isinstance(error, groq.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES
+    return False
+
+def is_rate_limited(error):
+    """Whether the upstream refused a call for exceeding its rate limit (429)"""
+    return isinstance(error, groq.APIStatusError) and error.status_code == 429
+
+def get_retry_after(error):
+    """
+    Seconds the upstream asked us to wait (Retry-After), if any
+    
+    Args:
+        error: Exception from the Groq SDK
+    
+    Returns:
+        float or None
+    """
+    response = getattr(error, 'response', None)
+    if response is None:
+        return None
+    headers = response.headers
+    
+    if headers.get('retry-after-ms'):
+        try:
+            return float(headers['retry-after-ms']) / 1000
+        except ValueError:
+            pass
+    
+    value = headers.get('retry-after')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class RetryPolicy:
+    """Bounded retries with full-jitter exponential backoff"""
+    
+    def __init__(self, max_retries=GROQ_MAX_RETRIES, base_delay=GROQ_RETRY_BASE_DELAY,
+                 max_delay=GROQ_RETRY_MAX_DELAY):
+        """
+        Initialize the policy
+        
+        Args:
+            max_retries: Attempts after the first one
+            base_delay: Backoff scale in seconds
+            max_delay: Longest wait between attempts; a longer Retry-After
+                gives up instead of holding the request
+        """
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+    
+    def delay(self, attempt, error=None):
+        """
+        Seconds to wait before retrying
+        
+        Args:
+            attempt: Number of attempts made so far (1 after the first)
+            error: The failure, for its Retry-After header
+        
+        Returns:
+            float or None: None when the upstream asks for longer than
+                max_delay, so the caller gives up now
+        """
+        retry_after = get_retry_after(error) if error is not None else None
+        if retry_after is not None:
+            return retry_after if retry_after <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+
+class CircuitBreaker:
+    """Opens after consecutive upstream failures, then lets one trial call through"""
+    
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_timeout=CIRCUIT_RESET_TIMEOUT):
+        """
+        Initialize the breaker
+        
+        Args:
+            failure_threshold: Consecutive failures that open the circuit
+            reset_timeout: Seconds the circuit stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        self._rejected = 0
+    
+    @property
+    def state(self):
+        """'closed', 'open' or 'half_open'"""
+        with self._lock:
+            return self._state()
+    
+    def _state(self):
+        """Current state (lock held)"""
+        if self._opened_at is None:
+            return 'closed'
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return 'half_open'
+        return 'open'
+    
+    def before_call(self):
+        """
+        Check that a call may go upstream
+        
+        Raises:
+            CircuitOpenError: While the circuit is open, or while the
+                half-open trial call is running
+        """
+        with self._lock:
+            state = self._state()
+            if state == 'closed':
+                return
+            if state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return
+            
+            self._rejected += 1
+            retry_after = max(1, round(self.reset_timeout - (time.monotonic() - self._opened_at)))
+            raise CircuitOpenError("AI service is unavailable, try again shortly", retry_after=retry_after)
+    
+    def record_success(self):
+        """The call succeeded: close the circuit"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+    
+    def record_failure(self):
+        """The upstream failed: count it, and (re)open the circuit at the threshold"""
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                if self._opened_at is None:
+                    print(f"Circuit opened after {self._failures} consecutive upstream failures")
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+    
+    def release(self):
+        """The call ended without telling anything about upstream health"""
+        with self._lock:
+            self._trial_running = False
+    
+    def stats(self):
+        """State and counters, for logging and health checks"""
+        with self._lock:
+            return {'state': self._state(), 'consecutive_failures': self._failures, 'rejected': self._rejected}
+
+def _record_outcome(breaker, error):
+    """Tell the breaker how an attempt went"""
+    if error is None:
+        breaker.record_success()
+    elif is_retryable(error) and not is_rate_limited(error):
+        breaker.record_failure()
+    else:
+        # Bad requests and auth errors say nothing about upstream health, and
+        # a 429 is a short throttle that the retries (and Retry-After) ride out
+        breaker.release()
+
+def _give_up(error):
+    """The error to raise once retries of a transient failure are exhausted"""
+    retry_after = get_retry_after(error)
+    return UpstreamUnavailableError(f"AI service unavailable: {str(error)}",
+                                    retry_after=max(1, round(retry_after or 1)))
+
+def call_with_retry(fn, policy, breaker=None):
+    """
+    Call fn(), retrying transient upstream failures
+    
+    Args:
+        fn: Callable making one upstream attempt
+        policy: RetryPolicy
+        breaker: Optional CircuitBreaker consulted before every attempt
+    
+    Returns:
+        fn's result
+    
+    Raises:
+        CircuitOpenError: If the breaker is open
+        UpstreamUnavailableError: If transient failures outlast the retries
+    """
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        attempt += 1
+        try:
+            result = fn()
+        except Exception as e:
+            if breaker is not None:
+                _record_outcome(breaker, e)
+            if not is_retryable(e):
+                raise
+            delay = policy.delay(attempt, e) if attempt <= policy.max_retries else None
+            if delay is None:
+                raise _give_up(e) from e
+            print(f"Upstream attempt {attempt} failed ({str(e)}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+            continue
+        
+        if breaker is not None:
+            _record_outcome(breaker, None)
+        return result
+
+async def async_call_with_retry(coro_fn, policy, breaker=None):
+    """Async version of call_with_retry; coro_fn returns the attempt's coroutine"""
+    attempt = 0
+    while True:
+        if breaker is not None:
+            breaker.before_call()
+        attempt += 1
+        try:
+            result = await coro_fn()
+        except asyncio.CancelledError:
+            if breaker is not None:
+                breaker.release()
+            raise
+        except Exception as e:
+            if breaker is not None:
+                _record_outcome(breaker, e)
+            if not is_retryable(e):
+                raise
+            delay = policy.delay(attempt, e) if attempt <= policy.max_retries else None
+            if delay is None:
+                raise _give_up(e) from e
+            print(f"Upstream attempt {attempt} failed ({str(e)}), retrying in {delay:.2f}s")
+            await asyncio.sleep(delay)
+            continue
+        
+        if breaker is not None:
+            _record_outcome(breaker, None)
+        return result
+
+class LatencyTracker:
+    """Recent latencies of successful calls, for percentile estimates"""
+    
+    def __init__(self, window=200):
+        """Keep the latest window samples"""
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+    
+    def record(self, seconds):
+        """Add the latency of one successful call"""
+        with self._lock:
+            self._samples.append(seconds)
+    
+    def __len__(self):
+        """Number of samples in the window"""
+        return len(self._samples)
+    
+    def percentile(self, pct):
+        """Nearest-rank percentile in seconds, or None without samples"""
+        with self._lock:
+            ordered = sorted(self._samples)
+        if not ordered:
+            return None
+        rank = max(1, min(len(ordered), math.ceil(pct / 100 * len(ordered))))
+        return ordered[rank - 1]
+
+class HedgePolicy:
+    """When to hedge a slow request, within a budget"""
+    
+    def __init__(self, model=GROQ_HEDGE_MODEL, percentile=GROQ_HEDGE_PERCENTILE, default_delay=GROQ_HEDGE_DELAY,
+                 budget=GROQ_HEDGE_BUDGET, min_samples=20):
+        """
+        Initialize the policy
+        
+        Args:
+            model: Model the hedged request goes to
+            percentile: Primary latency percentile after which to hedge
+            default_delay: Hedge delay until min_samples latencies are known
+            budget: Fraction of requests that may be hedged, so a slow
+                upstream doesn't get twice the load
+            min_samples: Latencies needed before the percentile is used
+        """
+        self.model = model
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.budget = budget
+        self.min_samples = min_samples
+        self.latency = LatencyTracker()
+        
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+    
+    def delay(self):
+        """Seconds to wait for the primary before hedging"""
+        if len(self.latency) < self.min_samples:
+            return self.default_delay
+        return self.latency.percentile(self.percentile)
+    
+    def start_request(self):
+        """Count a request towards the hedging budget"""
+        with self._lock:
+            self._requests += 1
+    
+    def try_hedge(self, breaker=None):
+        """Whether this request may be hedged now; counts it if so"""
+        # Never add load while the upstream is failing
+        if breaker is not None and breaker.state != 'closed':
+            return False
+        with self._lock:
+            if self._hedges + 1 > self.budget * self._requests:
+                return False
+            self._hedges += 1
+            return True
+    
+    def record_win(self):
+        """The hedged request answered first"""
+        with self._lock:
+            self._hedge_wins += 1
+    
+    def stats(self):
+        """Hedging counters and the current delay"""
+        with self._lock:
+            return {'model': self.model, 'requests': self._requests, 'hedges': self._hedges,
+                    'hedge_wins': self._hedge_wins, 'delay': self.delay()}
+
+def hedged_call(primary, secondary, policy, executor, breaker=None):
+    """
+    Run primary(); if it is slow, also run secondary() and take the first success
+    
+    The losing call is left to finish in the background (a blocking HTTP
+    call can't be interrupted) and its result is discarded.
+    
+    Args:
+        primary: Callable for the primary request
+        secondary: Callable for the hedged request
+        policy: HedgePolicy
+        executor: Executor the calls run on
+        breaker: Optional CircuitBreaker; no hedging unless it is closed
+    
+    Returns:
+        tuple: (result, hedged) - hedged is True when secondary's result won
+    """
+    policy.start_request()
+    first = executor.submit(primary)
+    done, _ = wait_futures([first], timeout=policy.delay())
+    if done or not policy.try_hedge(breaker):
+        return first.result(), False
+    
+    print(f"Primary model slower than {policy.delay():.2f}s, hedging to {policy.model}")
+    second = executor.submit(secondary)
+    pending = {first, second}
+    error = None
+    while pending:
+        done, pending = wait_futures(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                if future is second:
+                    policy.record_win()
+                return future.result(), future is second
+            error = error or future.exception()
+    raise error
+
+async def async_hedged_call(primary, secondary, policy, breaker=None):
+    """Async version of hedged_call; the losing request is cancelled"""
+    policy.start_request()
+    first = asyncio.ensure_future(primary())
+    done, _ = await asyncio.wait({first}, timeout=policy.delay())
+    if done or not policy.try_hedge(breaker):
+        try:
+            return await first, False
+        except asyncio.CancelledError:
+            first.cancel()
+            raise
+    
+    print(f"Primary model slower than {policy.delay():.2f}s, hedging to {policy.model}")
+    second = asyncio.ensure_future(secondary())
+    pending = {first, second}
+    error = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        policy.record_win()
+                    return task.result(), task is second
+                error = error or task.exception()
+        raise error
+    finally:
+        for task in (first, second):
+            if not task.done():
+                task.cancel()
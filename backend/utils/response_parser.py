@@ -0,0 +1,227 @@
+"""
+Model Response Parsing
+Incremental extraction of the JSON object the vision model answers with,
+and normalization of its fields into a detection result
+"""
+
+import re
+import json
+
+_decoder = json.JSONDecoder()
+
+SEVERITY_LEVELS = ('None', 'Mild', 'Moderate', 'Severe')
+
+class StreamingFieldExtractor:
+    """
+    Pulls top-level fields out of a JSON object while it is still streaming
+    
+    Text before the opening brace (prose, a ```json fence) is skipped. A
+    field is reported once its value is complete: strings, arrays and
+    objects when they close, numbers and literals once a delimiter follows.
+    """
+    
+    def __init__(self):
+        self.text = ''
+        self.fields = {}
+        self.complete = False   # Closing brace of the object seen
+        
+        self._pos = 0
+        self._state = 'start'
+        self._start = None      # Index of the opening brace
+        self._end = None        # Index just after the last complete value
+        self._key = None
+    
+    def feed(self, chunk):
+        """
+        Add streamed text
+        
+        Args:
+            chunk: Next piece of the completion
+        
+        Returns:
+            dict: Fields completed by this chunk (may be empty)
+        """
+        self.text += chunk
+        found = {}
+        text = self.text
+        
+        while not self.complete:
+            pos = self._skip_space(text, self._pos)
+            if pos >= len(text):
+                break
+            char = text[pos]
+            
+            if self._state == 'start':
+                brace = text.find('{', pos)
+                if brace < 0:
+                    self._pos = len(text)
+                    break
+                self._start = brace
+                self._pos = brace + 1
+                self._state = 'key'
+            
+            elif self._state == 'key':
+                if char == '}':
+                    self._finish(pos)
+                elif char == ',':
+                    self._pos = pos + 1
+                elif char == '"':
+                    try:
+                        self._key, self._pos = _decoder.raw_decode(text, pos)
+                    except ValueError:
+                        break   # Key still streaming
+                    self._state = 'colon'
+                else:
+                    self._pos = pos + 1   # Tolerate stray characters
+            
+            elif self._state == 'colon':
+                self._pos = pos + 1 if char == ':' else pos
+                self._state = 'value'
+            
+            elif self._state == 'value':
+                try:
+                    value, end = _decoder.raw_decode(text, pos)
+                except ValueError:
+                    break   # Value still streaming (or not JSON; the full parse deals with it)
+                if not isinstance(value, (str, list, dict)):
+                    # A number is only complete once a delimiter follows ("0." decodes as 0)
+                    after = self._skip_space(text, end)
+                    if after >= len(text) or text[after] not in ',}':
+                        break
+                self.fields[self._key] = found[self._key] = value
+                self._pos = self._end = end
+                self._state = 'comma'
+            
+            elif self._state == 'comma':
+                if char == '}':
+                    self._finish(pos)
+                else:
+                    self._pos = pos + 1 if char == ',' else pos
+                    self._state = 'key'
+        
+        return found
+    
+    def finish(self):
+        """
+        Mark the end of the text: accept a trailing number with no delimiter
+        (an answer cut off by max_tokens)
+        
+        Returns:
+            dict: All fields
+        """
+        if self._state == 'value':
+            pos = self._skip_space(self.text, self._pos)
+            try:
+                value, end = _decoder.raw_decode(self.text, pos)
+            except ValueError:
+                return self.fields
+            if self._skip_space(self.text, end) >= len(self.text):
+                self.fields[self._key] = value
+                self._end = end
+                self._state = 'comma'
+        return self.fields
+    
+    def has_fields(self, names):
+        """Whether all the given fields are complete"""
+        return all(name in self.fields for name in names)
+    
+    def partial_json(self):
+        """
+        The object so far, closed after the last complete field
+        
+        Returns:
+            str: Valid JSON text taken from the model's own output, or the
+                raw text if no field is complete yet
+        """
+        if self._start is None or self._end is None:
+            return self.text
+        if self.complete:
+            return self.text[self._start:self._end]
+        return self.text[self._start:self._end] + '}'
+    
+    def _finish(self, pos):
+        """Closing brace of the object at pos"""
+        self.complete = True
+        self._pos = self._end = pos + 1
+    
+    @staticmethod
+    def _skip_space(text, pos):
+        """Index of the first non-whitespace character from pos"""
+        while pos < len(text) and text[pos] in ' \t\r\n':
+            pos += 1
+        return pos
+
+def extract_json_fields(text):
+    """
+    Top-level fields of the JSON object in a model answer, in one pass
+    
+    Tolerates prose or code fences around the object, trailing commas and a
+    truncated ending; fields complete before the cut are kept.
+    
+    Args:
+        text: Model answer
+        
+    Returns:
+        dict: Fields found
+        
+    Raises:
+        ValueError: If the text holds no JSON object fields
+    """
+    extractor = StreamingFieldExtractor()
+    extractor.feed(text)
+    fields = extractor.finish()
+    if not fields:
+        raise ValueError("No JSON object in model response")
+    return fields
+
+def _as_confidence(value):
+    """Confidence as a float between 0 and 1 (accepts 0.85, 85, "85%")"""
+    if isinstance(value, str):
+        match = re.search(r'\d+(?:\.\d+)?', value)
+        value = float(match.group()) if match else 0.5
+    confidence = float(value)
+    if confidence > 1:
+        confidence = confidence / 100
+    return min(1.0, max(0.0, confidence))
+
+def _as_severity(value):
+    """Severity as one of SEVERITY_LEVELS, or 'Unknown'"""
+    text = str(value or '').strip().lower()
+    for level in SEVERITY_LEVELS:
+        if text.startswith(level.lower()):
+            return level
+    return 'Unknown'
+
+def _as_list(value):
+    """Symptoms as a list of non-empty strings"""
+    if isinstance(value, str):
+        value = re.split(r'[;,\n]', value)
+    if not isinstance(value, list):
+        return []
+    return [str(item).strip() for item in value if str(item).strip()]
+
+def parse_detection_response(text):
+    """
+    Parse a model answer into detection result fields
+    
+    Args:
+        text: Model answer
+        
+    Returns:
+        dict: disease, confidence, severity, symptoms and ai_recommendation,
+            plus image_notes if the answer has notes per photo
+        
+    Raises:
+        ValueError: If the answer holds no JSON object
+    """
+    fields = extract_json_fields(text)
+    result = {
+        'disease': str(fields.get('disease_detected') or 'Unknown').strip(),
+        'confidence': _as_confidence(fields.get('confidence', 0.5)),
+        'severity': _as_severity(fields.get('severity')),
+        'symptoms': _as_list(fields.get('symptoms_observed')),
+        'ai_recommendation': str(fields.get('recommendation') or '').strip()
+    }
+    if 'image_notes' in fields:
+        result['image_notes'] = _as_list(fields['image_notes'])
+    return result
@@ -0,0 +1,167 @@
+"""
+Detection Result Cache
+Remembers AI analyses by image content, so retried uploads and repeat scans
+of the same leaf don't pay for another upstream call
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+# Set RESULT_CACHE=false to always call the model
+RESULT_CACHE_ENABLED = os.getenv('RESULT_CACHE', 'true').lower() not in ('0', 'false', 'no', 'off')
+
+# Entries kept in memory (least recently used are evicted first)
+RESULT_CACHE_SIZE = int(os.getenv('RESULT_CACHE_SIZE', '1024'))
+
+# Seconds a result stays valid, in memory and on disk
+RESULT_CACHE_TTL = float(os.getenv('RESULT_CACHE_TTL', str(24 * 60 * 60)))
+
+# SQLite file for a tier that survives restarts; unset keeps the cache in memory only
+RESULT_CACHE_DB = os.getenv('RESULT_CACHE_DB') or None
+
+def make_cache_key(content_digest, crop_type, model, prompt_version, processing=None):
+    """
+    Build the cache key for one analysis
+    
+    Args:
+        content_digest: SHA-256 of the encoded image bytes sent to the model
+            (perceptual hashes collide across different photos, so they
+            never key a diagnosis)
+        crop_type: Crop the prompt was built for
+        model: Model name
+        prompt_version: Version of the prompt template
+        processing: Preprocessing settings the image was prepared with
+            (pipeline, enhancement tier, encoding profile), or None
+    
+    Returns:
+        str: Cache key
+    """
+    crop = (crop_type or 'unknown').lower()
+    return f"{prompt_version}:{model}:{crop}:{processing or '-'}:{content_digest}"
+
+class ResultCache:
+    """In-memory LRU with a TTL, backed by an optional SQLite file"""
+    
+    def __init__(self, max_entries=RESULT_CACHE_SIZE, ttl=RESULT_CACHE_TTL, db_path=RESULT_CACHE_DB):
+        """
+        Initialize the cache
+        
+        Args:
+            max_entries: Entries kept in memory
+            ttl: Seconds an entry stays valid
+            db_path: SQLite file for the persistent tier, or None
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        
+        self._entries = OrderedDict()  # key -> (expires_at, result)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'stores': 0}
+        
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, result TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._db.execute("DELETE FROM results WHERE expires_at <= ?", (time.time(),))
+            self._db.commit()
+    
+    def get(self, key):
+        """
+        Look up a result
+        
+        Returns:
+            dict or None: A copy of the cached result, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, result = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._counters['hits'] += 1
+                    return dict(result)
+                del self._entries[key]
+                self._counters['expired'] += 1
+            
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT result, expires_at FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    if row[1] > now:
+                        result = json.loads(row[0])
+                        self._remember(key, row[1], result)
+                        self._counters['disk_hits'] += 1
+                        return dict(result)
+                    self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._counters['expired'] += 1
+            
+            self._counters['misses'] += 1
+            return None
+    
+    def set(self, key, result):
+        """Store a result (a JSON-serializable dict) under key"""
+        expires_at = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires_at, dict(result))
+            self._counters['stores'] += 1
+            
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO results (key, result, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(result), expires_at)
+                )
+                self._db.commit()
+    
+    def clear(self):
+        """Drop every entry, in memory and on disk"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM results")
+                self._db.commit()
+    
+    def stats(self):
+        """Hit/miss counters and size, for logging and health checks"""
+        with self._lock:
+            lookups = self._counters['hits'] + self._counters['disk_hits'] + self._counters['misses']
+            hits = self._counters['hits'] + self._counters['disk_hits']
+            return dict(
+                self._counters,
+                size=len(self._entries),
+                max_entries=self.max_entries,
+                persistent=self._db is not None,
+                hit_rate=round(hits / lookups, 4) if lookups else 0.0
+            )
+    
+    def _remember(self, key, expires_at, result):
+        """Insert into the LRU, evicting the oldest entries (lock held)"""
+        self._entries[key] = (expires_at, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._counters['evictions'] += 1
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+def get_result_cache():
+    """Get the process-wide result cache, or None when RESULT_CACHE is off"""
+    global _result_cache
+    if not RESULT_CACHE_ENABLED:
+        return None
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache()
+    return _result_cache
@@ -0,0 +1,125 @@
+"""
+Single-Flight Request Coalescing
+Concurrent calls with the same key share one execution: the first caller
+runs it, the others wait and receive the same result (or exception)
+"""
+
+import asyncio
+import threading
+
+class _Call:
+    """An execution in progress and the callers waiting on it"""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Coalesces concurrent calls across threads"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._executions = 0
+        self._coalesced = 0
+    
+    def do(self, key, fn):
+        """
+        Run fn() once for all concurrent callers with this key
+        
+        Args:
+            key: Identity of the work (equal keys are coalesced)
+            fn: Callable doing the work
+        
+        Returns:
+            tuple: (result, shared) - shared is True for callers that
+                received another caller's result
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            shared = call is not None
+            if shared:
+                self._coalesced += 1
+            else:
+                call = self._calls[key] = _Call()
+                self._executions += 1
+        
+        if shared:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+    
+    def stats(self):
+        """Executions, coalesced callers and calls in flight"""
+        with self._lock:
+            return {'executions': self._executions, 'coalesced': self._coalesced, 'in_flight': len(self._calls)}
+
+class AsyncSingleFlight:
+    """Coalesces concurrent calls on one event loop"""
+    
+    def __init__(self):
+        self._calls = {}  # key -> [task, waiters]
+        self._executions = 0
+        self._coalesced = 0
+    
+    async def do(self, key, coro_fn):
+        """
+        Await coro_fn() once for all concurrent callers with this key
+        
+        The shared call runs as its own task, so one caller being cancelled
+        (or timing out) doesn't fail the others. It is cancelled only when
+        every caller waiting on it has gone.
+        
+        Args:
+            key: Identity of the work (equal keys are coalesced)
+            coro_fn: Function returning the coroutine doing the work
+        
+        Returns:
+            tuple: (result, shared) - shared is True for callers that
+                received another caller's result
+        """
+        entry = self._calls.get(key)
+        shared = entry is not None
+        if shared:
+            self._coalesced += 1
+        else:
+            task = asyncio.ensure_future(coro_fn())
+            entry = self._calls[key] = [task, 0]
+            self._executions += 1
+            task.add_done_callback(lambda _: self._forget(key, entry))
+        
+        task = entry[0]
+        entry[1] += 1
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and entry[1] == 1:
+                # Last caller gone: stop the work, and let newcomers start afresh
+                task.cancel()
+                self._forget(key, entry)
+            raise
+        finally:
+            entry[1] -= 1
+        return result, shared
+    
+    def _forget(self, key, entry):
+        """Drop a finished call, so later callers start a new one"""
+        if self._calls.get(key) is entry:
+            del self._calls[key]
+    
+    def stats(self):
+        """Executions, coalesced callers and calls in flight"""
+        return {'executions': self._executions, 'coalesced': self._coalesced, 'in_flight': len(self._calls)}
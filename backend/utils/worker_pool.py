@@ -0,0 +1,110 @@
+"""
+Bounded Worker Pool
+Runs the CPU-bound image pipeline off the request thread, with a limit on
+how much work may be running or waiting at once
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads running the pipeline. OpenCV and PIL release the GIL for the
+# heavy operations, so threads scale across cores without pickling images.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', os.cpu_count() or 2))
+
+# Jobs allowed to wait for a free worker before callers are turned away
+IMAGE_QUEUE_DEPTH = int(os.getenv('IMAGE_QUEUE_DEPTH', IMAGE_WORKERS * 2))
+
+# Seconds a caller waits for a queue slot before giving up
+IMAGE_QUEUE_TIMEOUT = float(os.getenv('IMAGE_QUEUE_TIMEOUT', '0.5'))
+
+class PoolSaturatedError(Exception):
+    """Raised when the pool and its queue are full"""
+    
+    def __init__(self, retry_after=1):
+        super().__init__("Image processing queue is full, try again shortly")
+        self.retry_after = retry_after
+
+class BoundedWorkerPool:
+    """Thread pool that rejects work instead of queueing without limit"""
+    
+    def __init__(self, max_workers=IMAGE_WORKERS, max_queue=IMAGE_QUEUE_DEPTH,
+                 queue_timeout=IMAGE_QUEUE_TIMEOUT):
+        """
+        Initialize the pool
+        
+        Args:
+            max_workers: Number of worker threads
+            max_queue: Jobs that may wait for a worker
+            queue_timeout: Seconds to wait for a slot before raising
+                PoolSaturatedError
+        """
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.queue_timeout = queue_timeout
+        
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='image-pipeline')
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+    
+    def submit(self, fn, *args, **kwargs):
+        """
+        Schedule fn(*args, **kwargs) on the pool
+        
+        Returns:
+            concurrent.futures.Future
+            
+        Raises:
+            PoolSaturatedError: If no slot frees up within queue_timeout
+        """
+        if not self._slots.acquire(timeout=self.queue_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise PoolSaturatedError(retry_after=max(1, round(self.queue_timeout * 2)))
+        
+        with self._lock:
+            self._pending += 1
+        
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._release(None)
+            raise
+        
+        future.add_done_callback(self._release)
+        return future
+    
+    def run(self, fn, *args, **kwargs):
+        """Run fn on the pool and wait for its result"""
+        return self.submit(fn, *args, **kwargs).result()
+    
+    def stats(self):
+        """Current load, for logging and health checks"""
+        with self._lock:
+            return {
+                'workers': self.max_workers,
+                'capacity': self.capacity,
+                'pending': self._pending,
+                'rejected': self._rejected
+            }
+    
+    def _release(self, future):
+        """Free the slot held by a finished job"""
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+_image_pool = None
+_image_pool_lock = threading.Lock()
+
+def get_image_pool():
+    """Get the process-wide image pipeline pool, creating it on first use"""
+    global _image_pool
+    if _image_pool is None:
+        with _image_pool_lock:
+            if _image_pool is None:
+                _image_pool = BoundedWorkerPool()
+    return _image_pool
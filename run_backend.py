@@ -12,6 +12,10 @@ from pathlib import Path
 from http.server import HTTPServer, BaseHTTPRequestHandler
 from urllib.parse import urlparse, parse_qs
 
+# Backend utilities (image processing, Groq client, request parsing)
+sys.path.append(str(Path(__file__).parent / "backend"))
+from utils.request_parser import parse_detect_request
+
 class CropGuardAPIHandler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
         """Handle CORS preflight requests"""
@@ -69,15 +73,17 @@ class CropGuardAPIHandler(BaseHTTPRequestHandler):
         
         if parsed_path.path == '/api/detect':
             try:
-                # Read request data
+                # Read request data (JSON with base64, raw image/* body or multipart/form-data)
                 content_length = int(self.headers.get('Content-Length', 0))
                 post_data = self.rfile.read(content_length)
-                request_data = json.loads(post_data.decode('utf-8'))
+                upload = parse_detect_request(self.headers.get('Content-Type', 'application/json'), post_data, self.path)
+                request_data = upload['fields']
+                image_data = upload['image_bytes'] or upload['image_base64']
                 
                 print(f"🔍 Received detection request for: {request_data.get('crop_type', 'unknown')}")
                 
                 # Check if we have required data
-                if 'image' not in request_data:
+                if not image_data:
                     raise ValueError("No image data provided")
                     
                 if 'crop_type' not in request_data:
@@ -102,28 +108,28 @@ class CropGuardAPIHandler(BaseHTTPRequestHandler):
                 # Try to use the real API
                 try:
                     # Import and use the real detection logic
-                    sys.path.append(str(Path(__file__).parent / "backend"))
-                    from utils.groq_client import GroqClient
-                    from utils.image_processor import decode_base64_image
+                    from utils.groq_client import get_detector
+                    from utils.image_processor import process_upload
                     
                     # Process the image
-                    image = decode_base64_image(request_data['image'])
+                    prepared = process_upload(image_data)
                     
-                    # Analyze with Groq
-                    groq_client = GroqClient()
-                    result = groq_client.analyze_plant_disease(
-                        image=image,
-                        crop_type=request_data['crop_type']
+                    # Analyze with Groq (one detector per process, reusing its connections)
+                    result = get_detector().analyze_plant_image(
+                        prepared['encoded'],
+                        crop_type=request_data['crop_type'],
+                        image_hash=prepared['image_hash'],
+                        processing=prepared['processing']
                     )
                     
                     # Format response
                     response_data = {
                         'success': True,
-                        'disease': result.get('disease_detected', 'Unknown'),
+                        'disease': result.get('disease', 'Unknown'),
                         'confidence': f"{int(result.get('confidence', 0) * 100)}",
                         'severity': result.get('severity', 'Unknown'),
-                        'symptoms': result.get('symptoms_observed', []),
-                        'ai_recommendation': result.get('recommendation', 'No recommendations available')
+                        'symptoms': result.get('symptoms', []),
+                        'ai_recommendation': result.get('ai_recommendation') or 'No recommendations available'
                     }
                     
                     print(f"✅ Analysis complete: {response_data['disease']}")
@@ -5,47 +5,21 @@ Tests both local backend and live API
 """
 
 import requests
-import base64
 import json
 import os
+import sys
 from pathlib import Path
 
 def create_test_image():
-    """Create a simple test image for testing"""
+    """Create a leaf-like test photo for testing"""
     try:
-        from PIL import Image, ImageDraw, ImageFont
-        import io
+        # Same synthetic leaf (spots, soil, sensor noise) the backend benchmarks use
+        sys.path.insert(0, str(Path(__file__).parent / "backend"))
+        from benchmarks.common import create_test_input
+        return create_test_input('jpeg', 400, 300)
         
-        # Create a simple plant-like image
-        img = Image.new('RGB', (400, 300), color='lightgreen')
-        draw = ImageDraw.Draw(img)
-        
-        # Draw some leaf-like shapes
-        draw.ellipse([50, 50, 150, 150], fill='green', outline='darkgreen', width=3)
-        draw.ellipse([200, 100, 300, 200], fill='green', outline='darkgreen', width=3)
-        draw.ellipse([100, 150, 200, 250], fill='darkgreen', outline='black', width=2)
-        
-        # Add some "disease" spots
-        draw.ellipse([80, 90, 100, 110], fill='brown')
-        draw.ellipse([230, 130, 250, 150], fill='yellow')
-        
-        # Add text
-        try:
-            draw.text((10, 10), "Test Plant Image", fill='black')
-        except:
-            pass  # Font might not be available
-        
-        # Save as JPEG bytes
-        img_byte_arr = io.BytesIO()
-        img.save(img_byte_arr, format='JPEG', quality=90)
-        img_byte_arr.seek(0)
-        
-        # Convert to base64
-        base64_str = base64.b64encode(img_byte_arr.getvalue()).decode()
-        return f"data:image/jpeg;base64,{base64_str}"
-        
-    except ImportError:
-        print("⚠️  PIL not available, using a simple text-based image")
+    except ImportError as e:
+        print(f"⚠️  Backend test image generator not available ({e}), using a minimal JPEG")
         # Fallback: create a minimal base64 image
         return "data:image/jpeg;base64,/9j/4AAQSkZJRgABAQEAAAAAAAD/2wBDAAEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQH/2wBDAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQEBAQH/wAARCABIAGQDASIAAhEBAxEB/8QAGwAAAgIDAQAAAAAAAAAAAAAABQYEBwIDCAH/xAAxEAABBAEEAQMDAwIGBwAAAAACAAEDBAURBhIhByITMQgUQVEjMmEJI3GBkaGx8P/EABkBAAMBAQEAAAAAAAAAAAAAAAABAgMEBf/EACQRAAICAgIBBAMBAAAAAAAAAAABAhEhMQMSQUEEUWGhEyJx/9oADAMBAAIRAxEAPwDwGvQM9AcEEA=="
 